@@ -1,26 +1,28 @@
 import multiprocessing
 import os
-import time
 from dotenv import load_dotenv
 import re
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support.ui import Select
-from selenium.webdriver.chrome.options import Options
 from datetime import date as dt
-from sqlalchemy import create_engine, Column, Integer, String, Date, Boolean, Text
+from sqlalchemy import create_engine, Column, Integer, String, Date, Boolean, Text, update, delete, any_, bindparam
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 
 import logging
-import random
 
 import itertools
 
+from joradp_parser import parse_law_ids
+from scraping_cursor import MAX_STORE_TRIES, Base as CursorBase, PageNotStored, ScrapingCursors
+from joradp_client import JoradpClient, get_client
+from joradp_throttle import MAX_CONCURRENCY, get_limiter, init_worker
+from chrome_pool import get_driver, page_loaded, release_driver, discard_driver, quit_driver
+
 load_dotenv()
 
 def setup_logger(name, log_file, level=logging.INFO):
@@ -83,18 +85,74 @@ class LawText(Base):
     page_fixed = Column(Boolean, default=False)
 
 
+class PendingLawField(Base):
+    # kita3 scraped for laws that were not in the db yet
+    __tablename__ = "pending_law_fields"
+    law_id = Column(Integer, primary_key=True, autoincrement=False)
+    field = Column(String)
+
+
 DB_URL = os.getenv("PG_URL")
 engine = create_engine(DB_URL)
 
+cursors = ScrapingCursors(engine, "kita3", main_logger)
+
+
+def scrape_kita3_law_data_http(kita3, start_date):
+    """Scrapes the kita3 with plain http requests, returns False when the
+    selenium scraper has to take over"""
+    client = get_client(main_logger)
+    page_logger = setup_logger(
+        f"page_0_{kita3}",
+        f"./kita3_scraping_logs/{kita3}/page0.log",
+    )
+    last_page = cursors.load(kita3, start_date)
+    # nothing to resume when the search has no results
+    number_of_pages = last_page
+    try:
+        for i, number_of_pages, page in client.search("zsec", kita3, start_date):
+            if i <= last_page:
+                page_logger.info(f"Page {i} of {kita3} already stored, skipping")
+                continue
+            page_logger.info(f"Starting kita3 scrape for {kita3}, page {i}")
+            allLawsIds = parse_law_ids(page.html)
+
+            if not storeLawkita3(kita3, allLawsIds, page_logger):
+                # the selenium scraper resumes from this page
+                raise PageNotStored(f"Page {i} of {kita3} not stored")
+            if i == last_page + 1:
+                cursors.save(kita3, start_date, i)
+                last_page = i
+
+            log_line = f" \n Finished scraping page {i} of {kita3} with {len(allLawsIds)} allLawsIds \n"
+            page_logger.info(log_line)
+            print(log_line)
+        cursors.keep_or_clear(kita3, start_date, last_page, number_of_pages)
+        return True
+    except Exception as e:
+        log_line = f"HTTP client failed for {kita3}: {e}, falling back to selenium"
+        print(log_line)
+        main_logger.error(log_line)
+        return False
+
 
 def scrape_kita3_law_data(kita3, start_date):
+    if scrape_kita3_law_data_http(kita3, start_date):
+        log_line = f"PROGRAM ENDED FOR {kita3} (http client)!!!"
+        print(log_line)
+        main_logger.info(log_line)
+        return
+
     number_of_pages = 0
     i = 0
     j = 0
+    store_failures = 0
 
     while i <= number_of_pages:
         i = 0
-        log_line = f"TRY NUMBER {j + 1} FOR {kita3}!!!"
+        # pages already committed by the previous tries
+        last_page = cursors.load(kita3, start_date)
+        log_line = f"TRY NUMBER {j + 1} FOR {kita3}, RESUMING AFTER PAGE {last_page}!!!"
         main_logger.info(log_line)
         print(log_line)
 
@@ -104,21 +162,12 @@ def scrape_kita3_law_data(kita3, start_date):
                 f"./kita3_scraping_logs/{kita3}/page{i}.log",
             )
 
-            random_duration = random.randint(3, 10)
-            # Wait for the random duration
-            time.sleep(random_duration)
-
-            options = Options()
-            options.add_argument("--disable-gpu")
-            options.add_argument("--headless=new")
-            driver = webdriver.Chrome(options=options)
+            # warm driver of this worker, only started on the first try
+            driver = get_driver()
 
             # Open the website
-            driver.get("https://www.joradp.dz/HAR/Index.htm")
-
-            random_duration = random.randint(3, 10)
-            # Wait for the random duration
-            time.sleep(random_duration)
+            with get_limiter().request():
+                driver.get("https://www.joradp.dz/HAR/Index.htm")
 
             wait = WebDriverWait(driver, 10)  # Timeout after 10 seconds
             frame = wait.until(EC.presence_of_element_located((By.XPATH, '//frame[@src="ATitre.htm"]')))
@@ -138,7 +187,8 @@ def scrape_kita3_law_data(kita3, start_date):
                     (By.XPATH, "/html/body/div/table[2]/tbody/tr/td[3]/a")
                 )
             )
-            search_link.click()
+            with get_limiter().request():
+                search_link.click()
 
             # Switch back to the default content before switching to another frame
             driver.switch_to.default_content()
@@ -168,8 +218,7 @@ def scrape_kita3_law_data(kita3, start_date):
                     (By.XPATH, '//a[contains(@title, "تشغيل البحث")]')
                 )
             )
-            search_button.click()
-            
+
             def page_ready(driver):
                 no_found_elements = driver.find_elements(
                     By.XPATH, '//*[@id="tit"]'
@@ -184,7 +233,10 @@ def scrape_kita3_law_data(kita3, start_date):
                     return True
                 return False
 
-            WebDriverWait(driver, 180, 2).until(page_ready)
+            # every page load draws from the shared joradp.dz budget
+            with get_limiter().request():
+                search_button.click()
+                WebDriverWait(driver, 180, 2).until(page_ready)
             log_line = f"Page {i} ready"
             page_logger.info(log_line)
             main_logger.info(log_line)
@@ -199,6 +251,8 @@ def scrape_kita3_law_data(kita3, start_date):
                 page_logger.info(log_line)
                 main_logger.info(log_line)
                 print(log_line)
+                # complete, the cursor has nothing left to resume
+                number_of_pages = last_page
                 break
             
             display_settings_link_elements = driver.find_elements(
@@ -207,7 +261,8 @@ def scrape_kita3_law_data(kita3, start_date):
 
             display_settings_link = display_settings_link_elements[0]
 
-            display_settings_link.click()
+            with get_limiter().request():
+                display_settings_link.click()
 
             pages_input = WebDriverWait(driver, 60).until(
                 EC.presence_of_element_located((By.NAME, "daff"))
@@ -220,11 +275,11 @@ def scrape_kita3_law_data(kita3, start_date):
                     (By.XPATH, "/html/body/div/form/table[2]/tbody/tr[1]/td/a")
                 )
             )
-            irsal_link.click()
-
-            numberOfPages = WebDriverWait(driver, 60).until(
-                EC.presence_of_element_located((By.XPATH, '//*[@id="tex"]'))
-            )
+            with get_limiter().request():
+                irsal_link.click()
+                numberOfPages = WebDriverWait(driver, 60).until(
+                    EC.presence_of_element_located((By.XPATH, '//*[@id="tex"]'))
+                )
             number_of_pages_text = numberOfPages.text
             pattern = r"العدد (\d+)"
             match = re.search(pattern, number_of_pages_text)
@@ -242,42 +297,52 @@ def scrape_kita3_law_data(kita3, start_date):
 
             while i <= number_of_pages:
 
-                allLawsIds.clear()
-                matching_rows = driver.find_elements(
-                    By.XPATH, '//tr[@bgcolor="#78a7b9"]'
-                )
-                # Iterate through the matching rows
-                page_logger.info(f"Starting kita3 scrape for {kita3}, page {i}")
-                row_number = 0
-                for row in matching_rows:
-                    row_number += 1
-                    log_line = f"----------------- \n row: {row_number}\n"
+                if i <= last_page:
+                    # already stored by a previous try, only navigate
+                    log_line = f"Page {i} of {kita3} already stored, skipping"
+                    page_logger.info(log_line)
+                    print(log_line)
+                else:
+                    allLawsIds.clear()
+                    matching_rows = driver.find_elements(
+                        By.XPATH, '//tr[@bgcolor="#78a7b9"]'
+                    )
+                    # Iterate through the matching rows
+                    page_logger.info(f"Starting kita3 scrape for {kita3}, page {i}")
+                    row_number = 0
+                    for row in matching_rows:
+                        row_number += 1
+                        log_line = f"----------------- \n row: {row_number}\n"
+                        page_logger.info(log_line)
+
+                        id_element = row.find_element(By.XPATH, ".//td[1]/a")
+                        id_element_href = id_element.get_attribute("href")
+                        match = re.search(r"#(\d+)", id_element_href)
+                        id_number = match.group(1)
+                        allLawsIds.append(int(id_number))
+
+                    log_line = (
+                        f" ----------------- \n Storing kita3 for allLawsIds in db...\n"
+                    )
                     page_logger.info(log_line)
 
-                    id_element = row.find_element(By.XPATH, ".//td[1]/a")
-                    id_element_href = id_element.get_attribute("href")
-                    match = re.search(r"#(\d+)", id_element_href)
-                    id_number = match.group(1)
-                    allLawsIds.append(int(id_number))
-
-                log_line = (
-                    f" ----------------- \n Storing kita3 for allLawsIds in db...\n"
-                )
-                page_logger.info(log_line)
-
-                storeLawkita3(kita3, allLawsIds, page_logger)
+                    if not storeLawkita3(kita3, allLawsIds, page_logger):
+                        raise PageNotStored(f"Page {i} of {kita3} not stored")
+                    if i == last_page + 1:
+                        cursors.save(kita3, start_date, i)
+                        last_page = i
 
-                log_line = f" ----------------- \n Stored the laws in db...\n"
-                page_logger.info(log_line)
-                print(log_line)
+                    log_line = f" ----------------- \n Stored the laws in db...\n"
+                    page_logger.info(log_line)
+                    print(log_line)
 
-                log_line = f" \n allLawsIds: {allLawsIds}  \n"
-                page_logger.info(log_line)
-                print(log_line)
+                    log_line = f" \n allLawsIds: {allLawsIds}  \n"
+                    page_logger.info(log_line)
+                    print(log_line)
 
-                log_line = f" \n Finished scraping page {i} of {kita3} with {len(allLawsIds)} allLawsIds \n"
-                page_logger.info(log_line)
-                print(log_line)
+                    log_line = f" \n Finished scraping page {i} of {kita3} with {len(allLawsIds)} allLawsIds \n"
+                    page_logger.info(log_line)
+                    print(log_line)
 
                 if i != number_of_pages:
                     next_page_button = WebDriverWait(driver, 60).until(
@@ -285,8 +350,6 @@ def scrape_kita3_law_data(kita3, start_date):
                             (By.XPATH, "//a[@href=\"javascript:Sauter('a',3);\"]")
                         )
                     )
-                    next_page_button.click()
-
                     expected_number = ((i + 1) * 200) + 1
 
                     def check_page(driver):
@@ -314,75 +377,116 @@ def scrape_kita3_law_data(kita3, start_date):
                     page_logger.info(log_line)
                     main_logger.info(log_line)
                     print(log_line)
-                    WebDriverWait(driver, 180, 2).until(check_page)
+                    with get_limiter().request():
+                        next_page_button.click()
+                        WebDriverWait(driver, 180, 2).until(check_page)
                     log_line = f"Successfully navigated to page {i + 1}"
                     page_logger.info(log_line)
                     main_logger.info(log_line)
                     print(log_line)
 
+                page_loaded()
                 i = i + 1
 
+        except PageNotStored as e:
+            # scraped again from the cursor, the driver is fine
+            store_failures += 1
+            log_line = f"{e}, try {store_failures} of {MAX_STORE_TRIES}"
+            print(log_line)
+            main_logger.error(log_line)
+            if store_failures >= MAX_STORE_TRIES:
+                break
+
         except TimeoutException as e:
             log_line = f"TimeoutException: {e} RETRYING..."
             print(log_line)
             main_logger.error(log_line)
+            discard_driver()
 
         except Exception as e:
             log_line = f"ERROR !!!!: {e} RETRYING..."
             print(log_line)
             main_logger.error(log_line)
+            discard_driver()
         finally:
-            if driver is not None:
-                driver.quit()
             j += 1
 
+    release_driver()
+    cursors.keep_or_clear(kita3, start_date, last_page, number_of_pages)
     log_line = f"PROGRAM ENDED AFTER {j + 1} TRIES FOR {kita3}!!!"
     print(log_line)
     main_logger.info(log_line)
 
 
 def storeLawkita3(kita3, allLawsIds, page_logger):
-    for law_id in allLawsIds:
-        Session = sessionmaker(bind=engine)
-        session = Session()
-        try:
-            # Check if the law text already exists
-            existing_law_text = session.query(LawText).get(law_id)
-            if existing_law_text:
-                # Update existing record
-                existing_law_text.field = kita3
-            else:
-                log_line = f"Law not found in db: LawId: {law_id}"
-                page_logger.error(log_line)
-            session.commit()
-            log_line = f" ----------------- \n kita3 for laws stored in db successfully and committed...\n"
-            page_logger.info(log_line)
-        except Exception as e:
-            session.rollback()
-            log_line = f"Error inserting kita3 for a law: {e}"
+    if not allLawsIds:
+        return True
+    try:
+        # one statement for the whole page
+        with engine.begin() as connection:
+            found_ids = set(
+                connection.execute(
+                    update(LawText)
+                    .where(LawText.id == any_(bindparam("ids", allLawsIds, type_=ARRAY(Integer))))
+                    .values(field=kita3)
+                    .returning(LawText.id)
+                ).scalars()
+            )
+            missing_ids = [law_id for law_id in set(allLawsIds) if law_id not in found_ids]
+            if missing_ids:
+                # the laws may not be scraped yet, keep them for reconcilePendingKita3
+                statement = insert(PendingLawField).values(
+                    [{"law_id": law_id, "field": kita3} for law_id in missing_ids]
+                )
+                connection.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=[PendingLawField.law_id],
+                        set_={"field": statement.excluded.field},
+                    )
+                )
+        if missing_ids:
+            log_line = f"Laws not found in db, kept as pending: LawIds: {missing_ids}"
             page_logger.error(log_line)
-        finally:
-            session.close()
-
-if __name__ == "__main__":
-
-    # Create database tables
-    Base.metadata.create_all(engine)
-    
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    
-    start_date = session.query(LastScrapingDate).first().kita3
+        log_line = f" ----------------- \n kita3 stored in db successfully and committed for {len(found_ids)} laws...\n"
+        page_logger.info(log_line)
+        return True
+    except Exception as e:
+        log_line = f"Error inserting kita3 for the laws: {e}"
+        page_logger.error(log_line)
+        return False
+
+
+def reconcilePendingKita3():
+    """Applies the pending kita3 of the laws that are now in the db"""
+    try:
+        with engine.begin() as connection:
+            reconciled_ids = (
+                connection.execute(
+                    update(LawText)
+                    .where(LawText.id == PendingLawField.law_id)
+                    .values(field=PendingLawField.field)
+                    .returning(LawText.id)
+                )
+                .scalars()
+                .all()
+            )
+            if reconciled_ids:
+                connection.execute(
+                    delete(PendingLawField).where(
+                        PendingLawField.law_id == any_(bindparam("ids", reconciled_ids, type_=ARRAY(Integer)))
+                    )
+                )
+        main_logger.info(f"Reconciled the pending kita3 of {len(reconciled_ids)} laws")
+    except Exception as e:
+        main_logger.error(f"Error reconciling the pending kita3: {e}")
 
 
-    # Initialize ChromeOptions
-    options = Options()
-    options.add_argument("--disable-gpu")
-    options.add_argument("--headless=new")
-    driver = webdriver.Chrome(options=options)
+def get_kita3_types_selenium():
+    driver = get_driver()
 
     # Open the website
-    driver.get("https://www.joradp.dz/HAR/Index.htm")
+    with get_limiter().request():
+        driver.get("https://www.joradp.dz/HAR/Index.htm")
 
     wait = WebDriverWait(driver, 10)  # Timeout after 10 seconds
     frame = wait.until(EC.presence_of_element_located((By.XPATH, '//frame[@src="ATitre.htm"]')))
@@ -402,7 +506,8 @@ if __name__ == "__main__":
             (By.XPATH, "/html/body/div/table[2]/tbody/tr/td[3]/a")
         )
     )
-    search_link.click()
+    with get_limiter().request():
+        search_link.click()
 
     # Switch back to the default content before switching to another frame
     driver.switch_to.default_content()
@@ -418,19 +523,56 @@ if __name__ == "__main__":
     options = select_object.options
     for option in options:
         kita3_types.append(option.text)
+    # the workers start their own drivers
+    quit_driver()
+    return kita3_types
+
+
+if __name__ == "__main__":
+
+    # Create database tables
+    Base.metadata.create_all(engine)
+    CursorBase.metadata.create_all(engine)
+    
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    
+    start_date = session.query(LastScrapingDate).first().kita3
+
+
+    client = JoradpClient(logger=main_logger)
+    try:
+        kita3_types = client.select_options("zsec")
+    except Exception as e:
+        main_logger.error(f"HTTP client failed to read the kita3 types: {e}")
+        kita3_types = get_kita3_types_selenium()
+    finally:
+        # the workers open their own connections
+        client.close()
     kita3_types = kita3_types[3:]    
     #kita3_types = ['الأمن العمومي', 'المناجم', 'المالية', 'الإتصال', 'المجاهدين', 'الإصلاح الإداري', 'الأشغال العمومية', 'النقل', 'الإقتصاد', 'الإعلام', 'البناء', 'التهيئة العمرانية', 'البيئة', 'التجهيز', 'التجارة', 'البحث العلمي', 'التخطيط', 'البرلمان', 'التربية والتعليم العالي', 'البريد', 'التضامن', 'التكوين المهني', 'الثقافة', 'الداخلية والجماعات المحلية', 'الدفاع الوطني', 'الري', 'الشؤون الإجتماعية', 'الشؤون الخارجية', 'الشؤون الدينية', 'الصناعة', 'الطاقة', 'الشباب والرياضة', 'السياحة', 'الصحة', 'الصيد', 'السكن', 'العمل', 'الغابات', 'العدل', 'الفلاحة', 'حقوق الإنسان', 'رئاسة الجمهورية', 'رئاسة الحكومة']
     print(kita3_types)
     main_logger.info(f"kita3_types : {kita3_types}")
-    driver.quit()
 
     law_types_iterator = iter(kita3_types)
-    with multiprocessing.Pool(processes=3) as pool:
+    # the workers share the joradp.dz budget, the limiter decides how many
+    # of them are loading a page at the same time
+    limiter = get_limiter()
+    with multiprocessing.Pool(
+        processes=MAX_CONCURRENCY, initializer=init_worker, initargs=(limiter,)
+    ) as pool:
         for result in pool.starmap(
             scrape_kita3_law_data, zip(law_types_iterator, itertools.repeat(start_date))
         ):
             pass
-        
+        # let the workers exit normally so that they quit their chrome
+        pool.close()
+        pool.join()
+    main_logger.info(f"joradp.dz throttle: {limiter.stats()}")
+    limiter.save()
+
+    reconcilePendingKita3()
+
     last_scraping_date = session.query(LastScrapingDate).first()
     last_scraping_date.kita3 = dt.today()
     session.commit()
@@ -35,11 +35,11 @@ scripts = [
     ("newspapers_scraper.py", "scrapy runspider"),
     ("laws_metadata_scraper.py", "python"),
     ("9ita3.py", "python"),
+    ("fix_pages.py", "scrapy runspider"),
     ("pdfs_to_images_conversion.py", "python"),
     ("ocr_images.py", "python"),
     ("text_extraction.py", "python"),
     ("fix_law_texts.py", "python"),
-    ("delete_all_photos.py", "python")
 ]
 
 
@@ -0,0 +1,116 @@
+import os
+import logging
+from multiprocessing import util
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options
+
+
+# A driver is recycled once it has loaded this many results pages
+MAX_PAGES_PER_DRIVER = 100
+
+# Resources the scrapers never look at
+BLOCKED_URLS = [
+    "*.png",
+    "*.jpg",
+    "*.jpeg",
+    "*.gif",
+    "*.ico",
+    "*.css",
+    "*.woff",
+    "*.woff2",
+    "*.ttf",
+    "*.otf",
+]
+
+logger = logging.getLogger(__name__)
+
+# One warm driver per worker process
+_driver = None
+_driver_pid = None
+_finalizer_pid = None
+_pages = 0
+
+
+def chrome_options():
+    options = Options()
+    options.add_argument("--disable-gpu")
+    options.add_argument("--headless=new")
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    # the scrapers wait for the elements they need themselves
+    options.page_load_strategy = "eager"
+    options.add_experimental_option(
+        "prefs",
+        {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.stylesheets": 2,
+            "profile.managed_default_content_settings.fonts": 2,
+        },
+    )
+    return options
+
+
+def _new_driver():
+    driver = webdriver.Chrome(options=chrome_options())
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+    except WebDriverException as e:
+        logger.warning(f"Could not block the page resources: {e}")
+    return driver
+
+
+def _alive(driver):
+    try:
+        driver.current_window_handle
+        return True
+    except WebDriverException:
+        return False
+
+
+def get_driver():
+    """Returns the warm driver of this process, starting a new one if there is
+    none yet or if the previous one crashed"""
+    global _driver, _driver_pid, _finalizer_pid, _pages
+    if _driver is not None and _driver_pid != os.getpid():
+        # inherited from the parent process through fork, not ours to use
+        _driver = None
+    if _driver is not None and not _alive(_driver):
+        discard_driver()
+    if _driver is None:
+        _driver = _new_driver()
+        _driver_pid = os.getpid()
+        _pages = 0
+        if _finalizer_pid != _driver_pid:
+            # quit chrome when the worker process exits
+            util.Finalize(None, quit_driver, exitpriority=10)
+            _finalizer_pid = _driver_pid
+    return _driver
+
+
+def page_loaded():
+    global _pages
+    _pages += 1
+
+
+def release_driver():
+    """Called when a task is done with the driver, recycles it once it has
+    served enough pages"""
+    if _pages >= MAX_PAGES_PER_DRIVER:
+        quit_driver()
+
+
+def discard_driver():
+    """Called after a crash / timeout, the next get_driver starts a new one"""
+    quit_driver()
+
+
+def quit_driver():
+    global _driver, _pages
+    if _driver is not None and _driver_pid == os.getpid():
+        try:
+            _driver.quit()
+        except Exception:
+            pass
+    _driver = None
+    _pages = 0
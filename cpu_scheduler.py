@@ -0,0 +1,134 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# One scheduler for the rendering (pdftoppm) and the OCR (tesseract) of the
+# pages, sized from the cores this process may actually run on. The work is
+# done by child processes or by code that releases the GIL (tesserocr,
+# numpy), the threads don't compete for it.
+
+# tesseract is several times slower than pdftoppm on a page
+OCR_SHARE = 0.75
+# rendered pages waiting for the OCR, bounds the memory used by the images
+MAX_PENDING_PAGES_PER_OCR_WORKER = 2
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # not available on every platform
+        return os.cpu_count() or 1
+
+
+def pin_threads():
+    """One thread per tesseract / OpenMP job, the parallelism comes from the
+    number of jobs. Only read by the tesseract processes started after it and
+    by libtesseract when loaded after it (ocr_engine pins on import)"""
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    os.environ["OMP_NUM_THREADS"] = "1"
+
+
+def split_cores(cores, ocr_share=OCR_SHARE):
+    """(render workers, ocr workers) sharing the cores, at least one each"""
+    if cores <= 1:
+        return 1, 1
+    ocr_workers = min(cores - 1, max(1, round(cores * ocr_share)))
+    return cores - ocr_workers, ocr_workers
+
+
+def cpu_time():
+    """CPU seconds of this process (tesserocr, numpy) and of its finished
+    children (pdftoppm, tesseract)"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class Stage:
+    """Thread pool that keeps count of its queue and busy time"""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+
+    def _run(self, fn, args, kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        start = time.monotonic()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.busy_seconds += time.monotonic() - start
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            self.queued += 1
+        return self.executor.submit(self._run, fn, args, kwargs)
+
+    def stats(self, elapsed):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                # share of the workers' time spent on a task
+                "utilisation": round(self.busy_seconds / (self.workers * elapsed), 3) if elapsed else 0.0,
+            }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+class CpuScheduler:
+    """Render and OCR stages sharing the cores of the host:
+    scheduler.render.submit(...), scheduler.ocr.submit(...)"""
+
+    def __init__(self, cores=None, ocr_share=OCR_SHARE):
+        pin_threads()
+        self.cores = cores or available_cores()
+        render_workers, ocr_workers = split_cores(self.cores, ocr_share)
+        self.render = Stage("render", render_workers)
+        self.ocr = Stage("ocr", ocr_workers)
+        # taken by the render workers before rendering, given back once the
+        # page is OCRed
+        self.pending_pages = threading.BoundedSemaphore(
+            ocr_workers * MAX_PENDING_PAGES_PER_OCR_WORKER
+        )
+        self._start = time.monotonic()
+        self._start_cpu = cpu_time()
+
+    def stats(self):
+        elapsed = time.monotonic() - self._start
+        cpu_seconds = cpu_time() - self._start_cpu
+        return {
+            "cores": self.cores,
+            "elapsed": round(elapsed, 1),
+            "render": self.render.stats(elapsed),
+            "ocr": self.ocr.stats(elapsed),
+            # close to 1: CPU bound, busy workers with a low value here are
+            # waiting on the disk
+            "cpu_utilisation": round(cpu_seconds / (self.cores * elapsed), 3) if elapsed else 0.0,
+        }
+
+    def shutdown(self):
+        self.render.shutdown()
+        self.ocr.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
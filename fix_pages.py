@@ -1,14 +1,23 @@
 import scrapy
 from scrapy import signals
 from datetime import date as dt
-from datetime import datetime
-from sqlalchemy import and_, create_engine, Column, Integer, String, Date, Boolean, Text
+from sqlalchemy import create_engine, Column, Integer, String, Date, Boolean, Text, select, update, values, column, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
-from bs4 import BeautifulSoup
+from page_maps import (
+    Base as PageMapsBase,
+    load_page_maps,
+    needs_remap,
+    page_map,
+    parse_printed_pages,
+    store_page_map,
+    usable_map,
+)
 import logging
 import os
 from dotenv import load_dotenv
+import joradp_throttle  # needed by DOWNLOADER_MIDDLEWARES
 
 load_dotenv()
 
@@ -38,6 +47,20 @@ def setup_logger(name, log_file, level=logging.INFO):
 Base = declarative_base()
 
 
+class LastScrapingDate(Base):
+    __tablename__ = "last_scraping_date"
+    id = Column(Integer, primary_key=True)
+    newspapers_scraper = Column(Date)
+    laws_metadata_scraper = Column(Date)
+    kita3 = Column(Date)
+    fix_pages = Column(Date)
+    ocr_images = Column(Date)
+    pdfs_to_images_conversion_journal_year = Column(Integer)
+    pdfs_to_images_conversion_journal_number = Column(Integer)
+    text_extraction = Column(Date)
+    fix_law_texts = Column(Date)
+
+
 class LawText(Base):
     __tablename__ = "laws"
     id = Column(Integer, primary_key=True, autoincrement=False)
@@ -60,16 +83,83 @@ engine = create_engine(DB_URL)
 Session = sessionmaker(bind=engine)
 session = Session()
 
+# first year of the journals index, used when fix_pages never ran
+FIRST_YEAR = 1964
+
+
+def year_bounds(year):
+    return dt(int(year), 1, 1), dt(int(year), 12, 31)
+
+
+def remap_journal_pages(connection, year, number, page_map):
+    """Replaces the printed page numbers of the laws of a journal by the
+    physical ones in one statement:
+    UPDATE laws SET journal_page = m.correct ... FROM (VALUES ...) m
+    the laws already fixed keep their page, the map can be applied again"""
+    if not page_map:
+        return 0
+    start_date, end_date = year_bounds(year)
+    mapping = values(
+        column("incorrect", Integer), column("correct", Integer), name="m"
+    ).data(list(page_map.items()))
+    statement = (
+        update(LawText)
+        .where(
+            LawText.journal_date >= start_date,
+            LawText.journal_date <= end_date,
+            LawText.journal_num == int(number),
+            LawText.page_fixed.is_(False),
+            LawText.journal_page == mapping.c.incorrect,
+        )
+        .values(journal_page=mapping.c.correct, page_fixed=True)
+    )
+    return connection.execute(statement).rowcount
+
+
+def unfixed_journals(connection, year):
+    """Numbers of the journals of the year having laws not page_fixed yet"""
+    start_date, end_date = year_bounds(year)
+    rows = connection.execute(
+        select(LawText.journal_num)
+        .where(
+            LawText.journal_date >= start_date,
+            LawText.journal_date <= end_date,
+            LawText.page_fixed.is_(False),
+        )
+        .distinct()
+    ).all()
+    return {row.journal_num for row in rows}
+
+
+def mark_journals_fixed(connection, year, numbers):
+    """The pages of these journals of the year are already right"""
+    start_date, end_date = year_bounds(year)
+    statement = (
+        update(LawText)
+        .where(
+            LawText.journal_date >= start_date,
+            LawText.journal_date <= end_date,
+            LawText.journal_num == any_(
+                bindparam("numbers", [int(n) for n in numbers], type_=ARRAY(Integer))
+            ),
+        )
+        .values(page_fixed=True)
+    )
+    return connection.execute(statement).rowcount
+
 
 class JoradpSpider(scrapy.Spider):
     main_logger = setup_logger(
         f"pdf_page_fixing_logs",
         f"./pdf_page_fixing_logs.log",
     )
-    data = {}
     name = 'joradp'
     currentYear = 0
     start_urls = ['https://www.joradp.dz/HAR/Index.htm']
+    custom_settings = {
+        # draw from the joradp.dz budget shared with the other scrapers
+        "DOWNLOADER_MIDDLEWARES": {"joradp_throttle.ThrottleMiddleware": 650},
+    }
 
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
@@ -80,11 +170,13 @@ class JoradpSpider(scrapy.Spider):
         return spider
 
     def parse(self, response):
-
-        start_date_str = input("Enter the last scraping year : ")
-        start_date = int(start_date_str)
-
         Base.metadata.create_all(engine)
+        PageMapsBase.metadata.create_all(engine)
+
+        # the year of the last run is done again, its journals may have
+        # been published after it
+        last_fix = session.query(LastScrapingDate).first().fix_pages
+        start_date = last_fix.year if last_fix else FIRST_YEAR
 
         href = "https://www.joradp.dz/JRN/ZA2024.htm"
         if href:
@@ -115,102 +207,98 @@ class JoradpSpider(scrapy.Spider):
         options = response.css(
             'form[name="zFrm2"] select[name="znjo"] option[value]:not(:empty)')
         year = response.meta['year']
-        year_data = {year: [option.attrib['value'] for option in options]}
-        self.data.update(year_data)
-
-        if len(self.data) == (self.currentYear - 1963):
-            yield scrapy.Request(url="https://www.joradp.dz", callback=self.process_laws)
-
-    def process_laws(self, response):
-        self.data = dict(sorted(self.data.items()))
-
-        for year, numbers in self.data.items():
-            if year < 2000:
-                for number in numbers:
-                    # fixing the laws for every newspaper
-                    if 1961 < year <= 1983:
-                        Lien = "Jo6283"
-                    elif 1983 < year:
-                        Lien = "Jo8499"
-
-                    if int(number) < 10:
-                        processed_number = f"00{int(number)}"
-                    elif 10 <= int(number) < 100:
-                        processed_number = f"0{int(number)}"
-                    else:
-                        processed_number = f"{int(number)}"
-
-                    base_url = f"https://www.joradp.dz/{Lien}/{year}/{processed_number}/A_Pag1.htm"
-
-                    yield scrapy.Request(base_url, callback=self.parse_law_text, meta={'year': year, 'number': processed_number})
-            else:
-                for number in numbers:
-                    start_date = dt(int(year), 1, 1)
-                    end_date = dt(int(year), 12, 31)
-
-                    rowsToCorrect = session.query(LawText).filter(
-                        and_(
-                            LawText.journal_date >= start_date,
-                            LawText.journal_date <= end_date,
-                            LawText.journal_num == int(number)
-                        )
-                    ).all()
-                    if (rowsToCorrect):
-                        for row in rowsToCorrect:
-                            row.page_fixed = True
-                        session.commit()
-                    self.main_logger.info(
-                        f"Fixed journal number {number} for the year {year}")
+        numbers = [option.attrib['value'] for option in options]
+
+        # this year's journals are fixed right away, without waiting for the
+        # index of the other years
+        self.main_logger.info(f"Year {year}: {len(numbers)} journals")
+        yield from self.process_laws(year, numbers)
+
+    def process_laws(self, year, numbers):
+        if year < 2000:
+            # the maps of these journals never change, only the ones that are
+            # not stored yet are downloaded
+            with engine.connect() as connection:
+                stored_maps = load_page_maps(connection, year)
+                unfixed = unfixed_journals(connection, year)
+            skipped = 0
+            for number in numbers:
+                if int(number) not in unfixed:
+                    # every law of the journal is fixed already (by an earlier
+                    # run or by hand), nothing to download nor to remap
+                    skipped += 1
+                    continue
+                printed_pages = stored_maps.get(int(number))
+                if printed_pages is not None:
+                    # laws scraped again since the map was applied have their
+                    # printed page back and page_fixed false
+                    self.apply_page_map(year, number, printed_pages)
+                    continue
+
+                # fixing the laws for every newspaper
+                if 1961 < year <= 1983:
+                    Lien = "Jo6283"
+                elif 1983 < year:
+                    Lien = "Jo8499"
+
+                if int(number) < 10:
+                    processed_number = f"00{int(number)}"
+                elif 10 <= int(number) < 100:
+                    processed_number = f"0{int(number)}"
+                else:
+                    processed_number = f"{int(number)}"
+
+                base_url = f"https://www.joradp.dz/{Lien}/{year}/{processed_number}/A_Pag1.htm"
+
+                yield scrapy.Request(base_url, callback=self.parse_law_text, meta={'year': year, 'number': processed_number})
+            self.main_logger.info(
+                f"Year {year}: {skipped} journals already fixed")
+        elif numbers:
+            # one statement for the whole year
+            try:
+                with engine.begin() as connection:
+                    fixed = mark_journals_fixed(connection, year, numbers)
+                self.main_logger.info(
+                    f"Fixed {len(numbers)} journals ({fixed} laws) for the year {year}")
+            except Exception as e:
+                self.main_logger.error(f"Error fixing the year {year}: {e}")
 
     def parse_law_text(self, response):
-        soup = BeautifulSoup(response.body, 'html.parser')
-        table_rows = soup.find_all('tr')
-        incorrect_numbers = [row.text.strip() for row in table_rows]
-
-        incorrect_numbers = incorrect_numbers[1:]
-        if (incorrect_numbers[0] != '1'):
-            # here we performe our correction in the db
-            correctPage = 1
-
-            start_date = dt(int(response.meta['year']), 1, 1)
-            end_date = dt(int(response.meta['year']), 12, 31)
-
-            for incorrect_number in incorrect_numbers:
-                rowsToCorrect = session.query(LawText).filter(
-                    and_(
-                        LawText.journal_date >= start_date,
-                        LawText.journal_date <= end_date,
-                        LawText.journal_page == incorrect_number,
-                        LawText.journal_num == int(response.meta['number'])
-                    )
-                ).all()
-
-                if (rowsToCorrect):
-                    for row in rowsToCorrect:
-                        row.journal_page = correctPage
-                        row.page_fixed = True
-                    session.commit()
-                correctPage += 1
-
-            self.main_logger.info(
-                f"Fixed journal number {response.meta['number']} for the year {response.meta['year']}")
-        else:
-            start_date = dt(int(response.meta['year']), 1, 1)
-            end_date = dt(int(response.meta['year']), 12, 31)
-
-            rowsToCorrect = session.query(LawText).filter(
-                and_(
-                    LawText.journal_date >= start_date,
-                    LawText.journal_date <= end_date,
-                    LawText.journal_num == int(response.meta['number'])
-                )
-            ).all()
-            if (rowsToCorrect):
-                for row in rowsToCorrect:
-                    row.page_fixed = True
-                session.commit()
+        year = response.meta['year']
+        number = response.meta['number']
+        printed_pages = parse_printed_pages(response.body)
+        if not usable_map(printed_pages):
+            # not stored, the journal is tried again next run
+            self.main_logger.error(
+                f"No page numbers in the page map of journal number {number} for the year {year}")
+            return
+        try:
+            with engine.begin() as connection:
+                store_page_map(connection, year, number, printed_pages)
+        except Exception as e:
+            self.main_logger.error(
+                f"Error storing the page map of journal number {number} for the year {year}: {e}")
+        self.apply_page_map(year, number, printed_pages)
+
+    def apply_page_map(self, year, number, printed_pages):
+        try:
+            with engine.begin() as connection:
+                if needs_remap(printed_pages):
+                    fixed = remap_journal_pages(
+                        connection, year, number, page_map(printed_pages))
+                else:
+                    fixed = mark_journals_fixed(connection, year, [number])
             self.main_logger.info(
-                f"Fixed journal number {response.meta['number']} for the year {response.meta['year']}")
-
-    def spider_closed(self, spider):
-        pass
+                f"Fixed journal number {number} for the year {year} ({fixed} laws)")
+        except Exception as e:
+            self.main_logger.error(
+                f"Error fixing journal number {number} for the year {year}: {e}")
+
+    def spider_closed(self, spider, reason):
+        if reason != "finished":
+            # the next run starts again from the same year
+            self.main_logger.error(f"Spider closed before the end: {reason}")
+            return
+        last_scraping_date = session.query(LastScrapingDate).first()
+        last_scraping_date.fix_pages = dt.today()
+        session.commit()
@@ -0,0 +1,284 @@
+import re
+import logging
+from urllib.parse import urljoin, urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup
+from joradp_throttle import get_limiter
+
+
+INDEX_URL = "https://www.joradp.dz/HAR/Index.htm"
+RESULTS_PER_PAGE = 200
+# journal date bounds of the search form
+START_DATE_FIELD = "znjd"
+END_DATE_FIELD = "znjf"
+TIMEOUT = (10, 180)
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:123.0) Gecko/20100101 Firefox/123.0",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Connection": "keep-alive",
+}
+
+
+_client = None
+
+
+def get_client(logger=None):
+    """One client (and connection pool) per worker process"""
+    global _client
+    if _client is None:
+        _client = JoradpClient(logger=logger)
+    return _client
+
+
+class JoradpClientError(Exception):
+    """The site did not answer the way the browser flow expects, the caller
+    should fall back to selenium"""
+
+
+class Page:
+    def __init__(self, url, html, soup):
+        self.url = url
+        self.html = html
+        self.soup = soup
+
+
+class JoradpClient:
+    """Replays the joradp.dz search flow (ATitre.htm -> FnCli search form ->
+    display settings -> Sauter pagination) with plain HTTP requests"""
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.session = requests.Session()
+        retries = Retry(
+            total=3,
+            backoff_factor=2,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["GET", "POST"],
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retries)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(HEADERS)
+        self.session.verify = False
+
+    def close(self):
+        self.session.close()
+
+    def _page(self, response):
+        response.raise_for_status()
+        soup = BeautifulSoup(response.content, "lxml")
+        html = response.content.decode(
+            soup.original_encoding or response.encoding or "utf-8", errors="replace"
+        )
+        return Page(response.url, html, soup)
+
+    def _send(self, method, url, **kwargs):
+        # every request to joradp.dz draws from the shared budget
+        with get_limiter().request() as outcome:
+            response = self.session.request(method, url, timeout=TIMEOUT, **kwargs)
+            outcome["ok"] = response.status_code < 500
+        return self._page(response)
+
+    def get(self, url, referer=None):
+        headers = {"Referer": referer} if referer else {}
+        return self._send("GET", url, headers=headers)
+
+    def submit(self, page, form, fields):
+        """Submits `form` of `page` like the browser would, with `fields`
+        overriding the values found in the form"""
+        data = form_values(form)
+        data.update(fields)
+        action = urljoin(page.url, form.get("action") or page.url)
+        # the site expects the values in the charset of the page
+        encoding = page.soup.original_encoding or "utf-8"
+        body = urlencode(data, encoding=encoding, errors="xmlcharrefreplace")
+        headers = {"Referer": page.url}
+        if (form.get("method") or "get").lower() == "post":
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            return self._send("POST", action, data=body, headers=headers)
+        separator = "&" if "?" in action else "?"
+        return self._send("GET", f"{action}{separator}{body}", headers=headers)
+
+    def open_search_form(self):
+        index = self.get(INDEX_URL)
+        frame = index.soup.find("frame", attrs={"src": "ATitre.htm"})
+        if frame is None:
+            raise JoradpClientError("ATitre.htm frame not found")
+        titles = self.get(urljoin(index.url, frame["src"]), referer=index.url)
+
+        # same link as /html/body/div/table[2]/tbody/tr/td[3]/a
+        link = titles.soup.select_one("body > div > table:nth-of-type(2) tr > td:nth-of-type(3) a")
+        href = link.get("href", "") if link else ""
+        if not href or href.startswith("javascript:"):
+            raise JoradpClientError(f"Unexpected search link: {href!r}")
+        return self.get(urljoin(titles.url, href), referer=titles.url)
+
+    def select_options(self, field):
+        """Texts of the options of the search form select `field`"""
+        search_page = self.open_search_form()
+        select = search_page.soup.find("select", attrs={"name": field})
+        if select is None:
+            raise JoradpClientError(f"Select {field} not found")
+        return [o.get_text(strip=True) for o in select.find_all("option")]
+
+    def results(self, field, value, start_date, end_date=None):
+        """First results page (200 per page) of the search where the select
+        `field` (znat / zsec) is `value`, None when nothing is found"""
+        search_page = self.open_search_form()
+        select = search_page.soup.find("select", attrs={"name": field})
+        if select is None:
+            raise JoradpClientError(f"Select {field} not found")
+        option = next(
+            (o for o in select.find_all("option") if o.get_text(strip=True) == value),
+            None,
+        )
+        if option is None:
+            raise JoradpClientError(f"Option {value} not found in {field}")
+        form = select.find_parent("form")
+
+        fields = {
+            field: option.get("value", option.get_text()),
+            START_DATE_FIELD: start_date.strftime("%d/%m/%Y"),
+        }
+        if end_date is not None:
+            if form.find(attrs={"name": END_DATE_FIELD}) is None:
+                raise JoradpClientError(f"Input {END_DATE_FIELD} not found")
+            fields[END_DATE_FIELD] = end_date.strftime("%d/%m/%Y")
+        results = self.submit(search_page, form, fields)
+        if results.soup.find(id="tit") is not None:
+            # No laws found
+            return None
+
+        # display settings: 200 results per page
+        settings_link = results.soup.select_one("body > div > table:nth-of-type(1) tr > td:nth-of-type(1) a")
+        if settings_link is None:
+            raise JoradpClientError("Display settings link not found")
+        settings = results
+        href = settings_link.get("href", "")
+        if href and not href.startswith("javascript:"):
+            settings = self.get(urljoin(results.url, href), referer=results.url)
+        daff = settings.soup.find("input", attrs={"name": "daff"})
+        if daff is None:
+            raise JoradpClientError("daff input not found")
+        return self.submit(
+            settings, daff.find_parent("form"), {"daff": str(RESULTS_PER_PAGE)}
+        )
+
+    def count(self, field, value, start_date, end_date=None):
+        """Number of results of the search ("العدد N"), None when the page
+        has results but no counter that could be read"""
+        page = self.results(field, value, start_date, end_date)
+        return results_count(page.soup) if page is not None else 0
+
+    def search(self, field, value, start_date, end_date=None):
+        """Yields (page index, number of pages, page) for every results page
+        of the search where the select `field` (znat / zsec) is `value`"""
+        page = self.results(field, value, start_date, end_date)
+        if page is None:
+            return
+
+        number_of_laws = results_count(page.soup)
+        if number_of_laws is None:
+            raise JoradpClientError("Results counter not found")
+        number_of_pages = int(number_of_laws / RESULTS_PER_PAGE)
+
+        i = 0
+        while True:
+            yield i, number_of_pages, page
+            if i >= number_of_pages:
+                break
+            page = self.next_page(page, i + 1)
+            i += 1
+
+    def next_page(self, page, index):
+        """Same as clicking javascript:Sauter('a',3);"""
+        fields, form = sauter_fields(page.soup, "a", "3")
+        next_page = self.submit(page, form, fields)
+        expected_number = (index * RESULTS_PER_PAGE) + 1
+        found_number = first_result_number(next_page.soup)
+        if found_number != expected_number:
+            raise JoradpClientError(
+                f"Pagination mismatch: expected {expected_number}, found {found_number}"
+            )
+        return next_page
+
+
+def form_values(form):
+    """Values the browser would submit for the form as it is"""
+    data = {}
+    for element in form.find_all(["input", "select", "textarea"]):
+        name = element.get("name")
+        if not name:
+            continue
+        if element.name == "input":
+            input_type = (element.get("type") or "text").lower()
+            if input_type in ("submit", "button", "image", "reset", "file"):
+                continue
+            if input_type in ("checkbox", "radio") and not element.has_attr("checked"):
+                continue
+            data[name] = element.get("value", "on" if input_type in ("checkbox", "radio") else "")
+        elif element.name == "select":
+            options = element.find_all("option")
+            selected = next((o for o in options if o.has_attr("selected")), None)
+            if selected is None and options:
+                selected = options[0]
+            if selected is not None:
+                data[name] = selected.get("value", selected.get_text())
+        else:
+            data[name] = element.get_text()
+    return data
+
+
+def results_count(soup):
+    """None when the counter is missing (layout change, truncated page), not
+    to be taken for an empty search"""
+    tex = soup.find(id="tex")
+    match = re.search(r"العدد (\d+)", tex.get_text(" ") if tex else "")
+    return int(match.group(1)) if match else None
+
+
+def first_result_number(soup):
+    tex = soup.find(id="tex")
+    match = re.search(r"من (\d+) إلى", tex.get_text(" ") if tex else "")
+    return int(match.group(1)) if match else None
+
+
+def sauter_fields(soup, *args):
+    """Reads the page's Sauter(...) javascript function and returns the form
+    fields it sets for the given arguments, with the form it submits"""
+    script = "\n".join(s.get_text() for s in soup.find_all("script"))
+    match = re.search(r"function\s+Sauter\s*\(([^)]*)\)\s*\{(.*?)\n\}", script, re.S)
+    if match is None:
+        raise JoradpClientError("Sauter function not found")
+    params = [p.strip() for p in match.group(1).split(",") if p.strip()]
+    values = dict(zip(params, args))
+
+    fields = {}
+    form_name = None
+    for form_ref, name, expr in re.findall(
+        r"([\w.\[\]'\"]+)\.(\w+)\.value\s*=\s*([^;]+);", match.group(2)
+    ):
+        expr = expr.strip()
+        if expr in values:
+            fields[name] = values[expr]
+        elif re.fullmatch(r"'[^']*'|\"[^\"]*\"|\d+", expr):
+            fields[name] = expr.strip("'\"")
+        else:
+            raise JoradpClientError(f"Can't replay Sauter assignment {name} = {expr}")
+        form_name = form_name or form_ref.split(".")[-1]
+    if not fields:
+        raise JoradpClientError("Sauter does not set any field")
+
+    form = soup.find("form", attrs={"name": form_name})
+    if form is None:
+        form = next(
+            (f for f in soup.find_all("form") if f.find(attrs={"name": next(iter(fields))})),
+            None,
+        )
+    if form is None:
+        raise JoradpClientError("Sauter form not found")
+    return fields, form
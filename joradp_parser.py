@@ -0,0 +1,241 @@
+import re
+import logging
+from datetime import date as dt
+import lxml.html
+
+
+# Pure parsing of the joradp.dz results pages: no selenium, no db, so that it
+# can be run (and measured, see parser_benchmark.py) on saved pages. The pages
+# are walked with lxml directly, a BeautifulSoup tree of a 200 laws page costs
+# more than the rest of the parsing.
+
+LAW_ROW_COLOR = "#78a7b9"
+ASSOC_ID_COLOR = "#9ec7d7"
+NO_DATE = dt.fromisoformat("9999-12-31")
+LAW_ROW_XPATH = f'//tr[@bgcolor="{LAW_ROW_COLOR}"]'
+
+arabic_months = {
+    "يناير": 1,
+    "فبراير": 2,
+    "مارس": 3,
+    "أبريل": 4,
+    "مايو": 5,
+    "يونيو": 6,
+    "يوليو": 7,
+    "غشت": 8,
+    "سبتمبر": 9,
+    "أكتوبر": 10,
+    "نوفمبر": 11,
+    "ديسمبر": 12,
+}
+
+DATE_PATTERN = re.compile(r"في (\d+) ([^\s]+) (\d+)")
+JO_OPEN_PATTERN = re.compile(r'JoOpen\("(\d+)", *"(\d+)", *"(\d+)", *"([A-Za-z]+)"\)')
+ID_PATTERN = re.compile(r"#(\d+)")
+NUMBER_PATTERN = re.compile(r"رقم (\S+)")
+
+logger = logging.getLogger(__name__)
+
+
+class LawRecord:
+    __slots__ = (
+        "id",
+        "text_type",
+        "text_number",
+        "journal_date",
+        "journal_num",
+        "journal_page",
+        "signature_date",
+        "ministry",
+        "content",
+    )
+
+    def __init__(
+        self,
+        id,
+        text_type="",
+        text_number="",
+        journal_date=NO_DATE,
+        journal_num=None,
+        journal_page=None,
+        signature_date=NO_DATE,
+        ministry="",
+        content="",
+    ):
+        self.id = id
+        self.text_type = text_type
+        self.text_number = text_number
+        self.journal_date = journal_date
+        self.journal_num = journal_num
+        self.journal_page = journal_page
+        self.signature_date = signature_date
+        self.ministry = ministry
+        self.content = content
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"LawRecord({fields})"
+
+
+class AssociationRecord:
+    __slots__ = ("id_out", "name", "ids_in")
+
+    def __init__(self, id_out, name, ids_in=None):
+        self.id_out = id_out
+        self.name = name
+        self.ids_in = ids_in if ids_in is not None else []
+
+    def __repr__(self):
+        return f"AssociationRecord(id_out={self.id_out!r}, name={self.name!r}, ids_in={self.ids_in!r})"
+
+
+def parse_arabic_date(text, year=None):
+    # "... في 12 يناير 2024" -> date, the year can be forced (journal date)
+    match = DATE_PATTERN.search(text)
+    if not match:
+        return NO_DATE
+    day, month, text_year = match.groups()
+    if year is None:
+        year = text_year
+    return dt(int(year), arabic_months[month], int(day))
+
+
+def element_strings(element, br=""):
+    """Text pieces of the element in document order, br for every <br>,
+    without the comments"""
+    if element.tag == "br":
+        yield br
+    elif element.text:
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str):
+            yield from element_strings(child, br)
+        if child.tail:
+            yield child.tail
+
+
+def element_text(element):
+    # Same text as selenium's WebElement.text: visible text with collapsed
+    # whitespace, <br> kept as line breaks
+    lines = " ".join(element_strings(element, br="\n")).split("\n")
+    return "\n".join(
+        " ".join(line.split()) for line in lines if line.strip()
+    )
+
+
+def find_link(element):
+    # first <a> under the element, None if there is none
+    return next(element.iter("a"), None)
+
+
+def page_rows(page_source):
+    """Law rows of a page source, none for an empty one"""
+    if not page_source.strip():
+        return []
+    return lxml.html.document_fromstring(page_source).xpath(LAW_ROW_XPATH)
+
+
+def law_rows(rows):
+    """Yields every law row with the rows that follow it, until the next law"""
+    for row in rows:
+        following = []
+        # itersiblings is lazy, only the rows up to the next law are read
+        for sibling in row.itersiblings():
+            if sibling.tag != "tr":
+                continue
+            if sibling.get("bgcolor") == LAW_ROW_COLOR:
+                break
+            following.append(sibling)
+        yield row, following
+
+
+def parse_results_page(page_source, law_type, page_logger=None):
+    """Extracts the laws and their associations from a results page source,
+    returns ([LawRecord], [AssociationRecord])"""
+    page_logger = page_logger or logger
+    laws = []
+    associations = []
+
+    row_number = 0
+    for row, following in law_rows(page_rows(page_source)):
+        row_number += 1
+        page_logger.info(f"----------------- \n row: {row_number}\n")
+        row_tds = row.findall("td")
+
+        journal_year = None
+        journal_num = None
+        journal_page = None
+        link_element = find_link(row_tds[1])
+        page = JO_OPEN_PATTERN.search(
+            link_element.get("href", "") if link_element is not None else ""
+        )
+        if page:
+            journal_year, journal_num, journal_page, _ = page.groups()
+            journal_num = int(journal_num)
+            journal_page = int(journal_page)
+
+        match = ID_PATTERN.search(find_link(row_tds[0]).get("href", ""))
+        law = LawRecord(int(match.group(1)), journal_num=journal_num, journal_page=journal_page)
+
+        # text rows of the law, then its associations
+        text_rows = []
+        association = None
+        for following_row in following:
+            td_elements = list(following_row.iter("td"))
+            if not td_elements:
+                continue
+
+            if td_elements[0].get("colspan") == "6":
+                text_rows.append(following_row)
+            elif len(td_elements) > 1 and td_elements[1].get("colspan") == "5":
+                if association is not None and association.name != "":
+                    associations.append(association)
+                font = next(td_elements[1].iter("font"), None)
+                association = AssociationRecord(
+                    law.id, "".join(element_strings(font)) if font is not None else ""
+                )
+                page_logger.info(f"Association: {association.name}\n")
+            elif (
+                td_elements[0].get("colspan") == "2"
+                and len(td_elements) == 3
+                and td_elements[2].get("bgcolor") == ASSOC_ID_COLOR
+                and association is not None
+            ):
+                link = find_link(td_elements[1])
+                match = ID_PATTERN.search(link.get("href", "") if link is not None else "")
+                if match:
+                    association.ids_in.append(int(match.group(1)))
+        if association is not None and association.name != "":
+            associations.append(association)
+
+        if len(text_rows) in (3, 4):
+            title = element_text(text_rows[0])
+            law.text_type = law_type
+            match = NUMBER_PATTERN.search(title)
+            law.text_number = match.group(1) if match else ""
+            law.signature_date = parse_arabic_date(title)
+
+            if len(text_rows) == 4:
+                # the ministry row is only there for some texts
+                law.ministry = element_text(text_rows[1])
+
+            if journal_year is not None:
+                law.journal_date = parse_arabic_date(
+                    element_text(text_rows[-2]), journal_year
+                )
+            law.content = element_text(text_rows[-1])
+            laws.append(law)
+        else:
+            page_logger.error(f" \n \n \n ERROR\n")
+
+    return laws, associations
+
+
+def parse_law_ids(page_source):
+    # ids of the laws listed in a results page
+    ids = []
+    for row in page_rows(page_source):
+        id_element = find_link(next(row.iter("td")))
+        match = ID_PATTERN.search(id_element.get("href", ""))
+        ids.append(int(match.group(1)))
+    return ids
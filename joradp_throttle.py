@@ -0,0 +1,224 @@
+import json
+import os
+import time
+import logging
+import multiprocessing
+from contextlib import contextmanager
+
+
+# Where the learned rate is kept between the stages of MAIN_SCRIPT.py
+STATE_PATH = "joradp_rate.json"
+
+INITIAL_RATE = 0.5  # requests / second
+MIN_RATE = 0.05
+MAX_RATE = 8.0
+RATE_INCREASE = 0.05  # additive increase per healthy response
+RATE_DECREASE = 0.5  # multiplicative decrease on timeouts / 5xx
+INITIAL_CONCURRENCY = 3
+MAX_CONCURRENCY = 8
+BURST = 4
+# Responses slower than this don't grow the budget
+TARGET_LATENCY = 10.0
+# Several workers failing at once only count as one congestion signal
+DECREASE_COOLDOWN = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveRateLimiter:
+    """Token bucket + AIMD shared by every job talking to joradp.dz.
+
+    The state lives in shared memory, so a limiter created before starting a
+    multiprocessing pool is shared by all the workers (see init_worker)."""
+
+    def __init__(
+        self,
+        rate=INITIAL_RATE,
+        concurrency=INITIAL_CONCURRENCY,
+        max_concurrency=MAX_CONCURRENCY,
+    ):
+        self.max_concurrency = max_concurrency
+        self._lock = multiprocessing.Lock()
+        self._rate = multiprocessing.RawValue("d", rate)
+        self._tokens = multiprocessing.RawValue("d", 1.0)
+        self._last_refill = multiprocessing.RawValue("d", time.monotonic())
+        self._last_decrease = multiprocessing.RawValue("d", 0.0)
+        self._concurrency = multiprocessing.RawValue("i", concurrency)
+        self._successes = multiprocessing.RawValue("i", 0)
+        self._in_flight = multiprocessing.RawValue("i", 0)
+        self._requests = multiprocessing.RawValue("i", 0)
+        self._errors = multiprocessing.RawValue("i", 0)
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill.value
+        self._tokens.value = min(BURST, self._tokens.value + elapsed * self._rate.value)
+        self._last_refill.value = now
+
+    def try_acquire(self):
+        """Takes a token and a concurrency slot if both are available and
+        returns None, otherwise returns how long to wait before trying again"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if (
+                self._tokens.value >= 1
+                and self._in_flight.value < self._concurrency.value
+            ):
+                self._tokens.value -= 1
+                self._in_flight.value += 1
+                return None
+            wait = max(0.0, (1 - self._tokens.value) / self._rate.value)
+        return min(max(wait, 0.05), 1.0)
+
+    def acquire(self):
+        """Blocks until a token and a concurrency slot are available"""
+        while True:
+            wait = self.try_acquire()
+            if wait is None:
+                return
+            time.sleep(wait)
+
+    def release(self, latency, ok):
+        with self._lock:
+            self._in_flight.value = max(0, self._in_flight.value - 1)
+            self._requests.value += 1
+            now = time.monotonic()
+            if not ok:
+                self._errors.value += 1
+                if now - self._last_decrease.value >= DECREASE_COOLDOWN:
+                    self._last_decrease.value = now
+                    self._rate.value = max(MIN_RATE, self._rate.value * RATE_DECREASE)
+                    self._concurrency.value = max(1, self._concurrency.value // 2)
+                    self._successes.value = 0
+                    logger.info(f"joradp.dz struggling, backing off: {self.stats()}")
+            elif latency <= TARGET_LATENCY:
+                self._rate.value = min(MAX_RATE, self._rate.value + RATE_INCREASE)
+                self._successes.value += 1
+                # one more slot per "round" of healthy responses
+                if self._successes.value >= self._concurrency.value:
+                    self._successes.value = 0
+                    self._concurrency.value = min(
+                        self.max_concurrency, self._concurrency.value + 1
+                    )
+
+    @contextmanager
+    def request(self):
+        """with limiter.request() as outcome: ... ; set outcome["ok"] = False
+        for bad answers, exceptions count as failures"""
+        self.acquire()
+        outcome = {"ok": True}
+        start = time.monotonic()
+        try:
+            yield outcome
+        except BaseException:
+            self.release(time.monotonic() - start, False)
+            raise
+        self.release(outcome.get("latency", time.monotonic() - start), outcome["ok"])
+
+    @property
+    def rate(self):
+        return self._rate.value
+
+    @property
+    def concurrency(self):
+        return self._concurrency.value
+
+    def stats(self):
+        return {
+            "rate": round(self._rate.value, 3),
+            "concurrency": self._concurrency.value,
+            "in_flight": self._in_flight.value,
+            "requests": self._requests.value,
+            "errors": self._errors.value,
+        }
+
+    def save(self, path=STATE_PATH):
+        with open(path, "w") as f:
+            json.dump({"rate": self.rate, "concurrency": self.concurrency}, f)
+
+    @classmethod
+    def load(cls, path=STATE_PATH, max_concurrency=MAX_CONCURRENCY):
+        """Starts from the rate learned by the previous stage, if any"""
+        rate, concurrency = INITIAL_RATE, INITIAL_CONCURRENCY
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    state = json.load(f)
+                rate = min(MAX_RATE, max(MIN_RATE, float(state["rate"])))
+                concurrency = min(max_concurrency, max(1, int(state["concurrency"])))
+            except (ValueError, KeyError, TypeError):
+                pass
+        return cls(rate=rate, concurrency=concurrency, max_concurrency=max_concurrency)
+
+
+_limiter = None
+
+
+def get_limiter():
+    """The limiter of this process (shared with the pool workers)"""
+    global _limiter
+    if _limiter is None:
+        _limiter = AdaptiveRateLimiter.load()
+    return _limiter
+
+
+def init_worker(limiter):
+    """multiprocessing.Pool initializer: share the parent's limiter"""
+    global _limiter
+    _limiter = limiter
+
+
+class ThrottleMiddleware:
+    """Scrapy downloader middleware drawing joradp.dz requests from the shared
+    limiter and adapting the download slots' concurrency to it"""
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.limiter = get_limiter()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        from scrapy import signals
+
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    async def process_request(self, request, spider):
+        from twisted.internet import reactor
+        from twisted.internet.task import deferLater
+
+        # same token and concurrency slot as the blocking workers, waited for
+        # without blocking the reactor
+        while True:
+            wait = self.limiter.try_acquire()
+            if wait is None:
+                break
+            await deferLater(reactor, wait, lambda: None)
+        request.meta["throttle_start"] = time.monotonic()
+        return None
+
+    def _done(self, request, ok):
+        start = request.meta.pop("throttle_start", None)
+        if start is None:
+            return
+        latency = request.meta.get("download_latency", time.monotonic() - start)
+        self.limiter.release(latency, ok)
+        self.crawler.stats.set_value("joradp/throttle/rate", round(self.limiter.rate, 3))
+        # let scrapy run as many requests at once as the limiter allows
+        slot_key = request.meta.get("download_slot")
+        slots = getattr(self.crawler.engine.downloader, "slots", {})
+        if slot_key in slots:
+            slots[slot_key].concurrency = self.limiter.concurrency
+
+    def process_response(self, request, response, spider):
+        self._done(request, response.status < 500)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        self._done(request, False)
+        return None
+
+    def spider_closed(self, spider):
+        spider.logger.info(f"joradp.dz throttle: {self.limiter.stats()}")
+        self.limiter.save()
@@ -0,0 +1,56 @@
+from sqlalchemy import Column, Integer, String, Date, Boolean, select, extract, func
+from sqlalchemy.orm import declarative_base
+
+
+# Pages of the journals that text_extraction reads: from the first page of a
+# page_fixed law of the journal to the end of the pdf, the text of the last
+# law has no next law to end it and can run over tens of pages of annexes.
+# The cover and the summary before the first law are never OCRed; a law fixed
+# later on widens the range of its journal at the next run.
+
+Base = declarative_base()
+
+
+class LawText(Base):
+    __tablename__ = "laws"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    text_type = Column(String)
+    journal_date = Column(Date)
+    journal_num = Column(Integer)
+    journal_page = Column(Integer)
+    page_fixed = Column(Boolean, default=False)
+
+
+def required_pages(db_engine):
+    """{(year, number): (first_page, None)} of the journals having page_fixed
+    laws, None: through the last page of the pdf"""
+    year = extract("year", LawText.journal_date)
+    statement = (
+        select(
+            year,
+            LawText.journal_num,
+            func.min(LawText.journal_page),
+        )
+        .where(
+            LawText.page_fixed == True,
+            LawText.journal_page >= 1,
+            LawText.journal_num.isnot(None),
+        )
+        .group_by(year, LawText.journal_num)
+    )
+    with db_engine.connect() as connection:
+        return {
+            (int(row[0]), row[1]): (row[2], None)
+            for row in connection.execute(statement)
+        }
+
+
+def pages_in(page_numbers, page_range):
+    """The page_numbers inside the (first_page, last_page) page_range, no
+    upper bound when last_page is None"""
+    first_page, last_page = page_range
+    return [
+        page_number
+        for page_number in page_numbers
+        if first_page <= page_number and (last_page is None or page_number <= last_page)
+    ]
@@ -2,22 +2,23 @@ import multiprocessing
 import os
 import time
 import re
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support.ui import Select
-from selenium.webdriver.chrome.options import Options
-from datetime import date as dt
-from sqlalchemy import create_engine, Column, Integer, String, Date, Boolean, Text
+from datetime import date as dt, timedelta
+from sqlalchemy import create_engine, Column, Integer, String, Date, Boolean, Text, case, or_, literal_column
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from dotenv import load_dotenv
+from joradp_parser import parse_results_page
+from scraping_cursor import MAX_STORE_TRIES, Base as CursorBase, PageNotStored, ScrapingCursors, unit_name
+from joradp_client import END_DATE_FIELD, RESULTS_PER_PAGE, JoradpClient, get_client
+from joradp_throttle import MAX_CONCURRENCY, get_limiter, init_worker
+from chrome_pool import get_driver, page_loaded, release_driver, discard_driver, quit_driver
 import logging
-import random
-import itertools
 
 
 load_dotenv()
@@ -93,56 +94,85 @@ class Association(Base):
 DB_URL = os.getenv("PG_URL")
 engine = create_engine(DB_URL)
 
-arabic_months = {
-    "يناير": "01",
-    "فبراير": "02",
-    "مارس": "03",
-    "أبريل": "04",
-    "مايو": "05",
-    "يونيو": "06",
-    "يوليو": "07",
-    "غشت": "08",
-    "سبتمبر": "09",
-    "أكتوبر": "10",
-    "نوفمبر": "11",
-    "ديسمبر": "12",
-}
-
-
-def scrape_law_data(law_type, start_date):
+cursors = ScrapingCursors(engine, "laws_metadata", main_logger)
+
+
+def scrape_law_data_http(law_type, start_date, end_date=None):
+    """Scrapes the law type with plain http requests, returns False when the
+    selenium scraper has to take over"""
+    client = get_client(main_logger)
+    name = unit_name(law_type, start_date, end_date)
+    page_logger = setup_logger(
+        f"page_0_{name}",
+        f"./pages_scraping_logs/{name}/page0.log",
+    )
+    last_page = cursors.load(law_type, start_date, end_date)
+    # nothing to resume when the search has no results
+    number_of_pages = last_page
+    try:
+        for i, number_of_pages, page in client.search(
+            "znat", law_type, start_date, end_date
+        ):
+            if i <= last_page:
+                page_logger.info(f"Page {i} of {name} already stored, skipping")
+                continue
+            page_logger.info(f"Starting scrape for {name}, page {i}")
+            lawTexts, allAssoc = parse_results_page(page.html, law_type, page_logger)
+
+            stored_laws = storeLawText(lawTexts, page_logger)
+            stored_assoc = storeLawAssociations(allAssoc, page_logger)
+            if not (stored_laws and stored_assoc):
+                # the selenium scraper resumes from this page
+                raise PageNotStored(f"Page {i} of {name} not stored")
+            if i == last_page + 1:
+                cursors.save(law_type, start_date, i, end_date)
+                last_page = i
+
+            log_line = f" \n Finished scraping page {i} of {name} with {len(lawTexts)} law and {len(allAssoc)} assoc \n"
+            page_logger.info(log_line)
+            print(log_line)
+        cursors.keep_or_clear(law_type, start_date, last_page, number_of_pages, end_date)
+        return True
+    except Exception as e:
+        log_line = f"HTTP client failed for {name}: {e}, falling back to selenium"
+        print(log_line)
+        main_logger.error(log_line)
+        return False
+
+
+def scrape_law_data(law_type, start_date, end_date=None):
+    name = unit_name(law_type, start_date, end_date)
+    if scrape_law_data_http(law_type, start_date, end_date):
+        log_line = f"PROGRAM ENDED FOR {name} (http client)!!!"
+        print(log_line)
+        main_logger.info(log_line)
+        return
+
     number_of_pages = 0
     i = 0
     j = 0
-    lawTexts = []
-    allAssoc = []
+    store_failures = 0
 
     while i <= number_of_pages:
         i = 0
-        log_line = f"TRY NUMBER {j + 1} FOR {law_type}!!!"
+        # pages already committed by the previous tries
+        last_page = cursors.load(law_type, start_date, end_date)
+        log_line = f"TRY NUMBER {j + 1} FOR {name}, RESUMING AFTER PAGE {last_page}!!!"
         main_logger.info(log_line)
         print(log_line)
 
         try:
             page_logger = setup_logger(
-                f"page_{i}_{law_type}",
-                f"./pages_scraping_logs/{law_type}/page{i}.log",
+                f"page_{i}_{name}",
+                f"./pages_scraping_logs/{name}/page{i}.log",
             )
 
-            random_duration = random.randint(3, 10)
-            # Wait for the random duration
-            time.sleep(random_duration)
-
-            options = Options()
-            options.add_argument("--disable-gpu")
-            options.add_argument("--headless=new")
-            driver = webdriver.Chrome(options=options)
+            # warm driver of this worker, only started on the first try
+            driver = get_driver()
 
             # Open the website
-            driver.get("https://www.joradp.dz/HAR/Index.htm")
-
-            random_duration = random.randint(3, 10)
-            # Wait for the random duration
-            time.sleep(random_duration)
+            with get_limiter().request():
+                driver.get("https://www.joradp.dz/HAR/Index.htm")
 
             # Switch to the frame with src="ATitre.htm"
             driver.switch_to.frame(
@@ -162,7 +192,8 @@ def scrape_law_data(law_type, start_date):
                     (By.XPATH, "/html/body/div/table[2]/tbody/tr/td[3]/a")
                 )
             )
-            search_link.click()
+            with get_limiter().request():
+                search_link.click()
 
             # Switch back to the default content before switching to another frame
             driver.switch_to.default_content()
@@ -186,13 +217,19 @@ def scrape_law_data(law_type, start_date):
             date_input.clear()
             date_input.send_keys(start_date.strftime("%d/%m/%Y"))
 
+            if end_date is not None:
+                end_date_input = WebDriverWait(driver, 60).until(
+                    EC.presence_of_element_located((By.NAME, END_DATE_FIELD))
+                )
+                end_date_input.clear()
+                end_date_input.send_keys(end_date.strftime("%d/%m/%Y"))
+
             # Click on the "بــحـــث" button
             search_button = WebDriverWait(driver, 60).until(
                 EC.element_to_be_clickable(
                     (By.XPATH, '//a[contains(@title, "تشغيل البحث")]')
                 )
             )
-            search_button.click()
 
             def page_ready(driver):
                 no_found_elements = driver.find_elements(By.XPATH, '//*[@id="tit"]')
@@ -206,8 +243,11 @@ def scrape_law_data(law_type, start_date):
                     return True
                 return False
 
-            WebDriverWait(driver, 180, 2).until(page_ready)
-            log_line = f"Page {i} of {law_type} ready"
+            # every page load draws from the shared joradp.dz budget
+            with get_limiter().request():
+                search_button.click()
+                WebDriverWait(driver, 180, 2).until(page_ready)
+            log_line = f"Page {i} of {name} ready"
             page_logger.info(log_line)
             main_logger.info(log_line)
             print(log_line)
@@ -215,10 +255,12 @@ def scrape_law_data(law_type, start_date):
             no_found_elements = driver.find_elements(By.XPATH, '//*[@id="tit"]')
             # No laws found
             if len(no_found_elements) > 0:
-                log_line = f"Page {i} of {law_type}: No laws found!"
+                log_line = f"Page {i} of {name}: No laws found!"
                 page_logger.info(log_line)
                 main_logger.info(log_line)
                 print(log_line)
+                # complete, the cursor has nothing left to resume
+                number_of_pages = last_page
                 break
 
             display_settings_link_elements = driver.find_elements(
@@ -227,7 +269,8 @@ def scrape_law_data(law_type, start_date):
 
             display_settings_link = display_settings_link_elements[0]
 
-            display_settings_link.click()
+            with get_limiter().request():
+                display_settings_link.click()
 
             pages_input = WebDriverWait(driver, 60).until(
                 EC.presence_of_element_located((By.NAME, "daff"))
@@ -240,11 +283,11 @@ def scrape_law_data(law_type, start_date):
                     (By.XPATH, "/html/body/div/form/table[2]/tbody/tr[1]/td/a")
                 )
             )
-            irsal_link.click()
-
-            numberOfPages = WebDriverWait(driver, 60).until(
-                EC.presence_of_element_located((By.XPATH, '//*[@id="tex"]'))
-            )
+            with get_limiter().request():
+                irsal_link.click()
+                numberOfPages = WebDriverWait(driver, 60).until(
+                    EC.presence_of_element_located((By.XPATH, '//*[@id="tex"]'))
+                )
             number_of_pages_text = numberOfPages.text
             pattern = r"العدد (\d+)"
             match = re.search(pattern, number_of_pages_text)
@@ -255,298 +298,58 @@ def scrape_law_data(law_type, start_date):
 
             number_of_pages = int(int(number_of_laws) / 200)
 
-            directory = f"./pages_scraping_logs/{law_type}"
+            directory = f"./pages_scraping_logs/{name}"
             os.makedirs(directory, exist_ok=True)
 
             while i <= number_of_pages:
-                lawTexts.clear()
-                allAssoc.clear()
-                matching_rows = driver.find_elements(
-                    By.XPATH, '//tr[@bgcolor="#78a7b9"]'
-                )
-                # Iterate through the matching rows
-                page_logger.info(f"Starting scrape for {law_type}, page {i}")
-                row_number = 0
-                for row in matching_rows:
-                    row_number += 1
-                    log_line = f"----------------- \n row: {row_number}\n"
+                if i <= last_page:
+                    # already stored by a previous try, only navigate
+                    log_line = f"Page {i} of {name} already stored, skipping"
                     page_logger.info(log_line)
-                    object = {
-                        "id": -1,
-                        "textType": "",
-                        "textNumber": "",
-                        "journalDate": "",
-                        "journalNum": "",
-                        "journalPage": "",
-                        "signatureDate": "",
-                        "ministry": "",
-                        "content": "",
-                        "longContent": "",
-                    }
-                    # Find the a element within the current row
-                    link_element = row.find_element(By.XPATH, ".//td[2]/a")
-                    # Get the href attribute value and append it to the array
-                    href_value = link_element.get_attribute("href")
-                    page = re.search(
-                        r'JoOpen\("(\d+)", *"(\d+)", *"(\d+)", *"([A-Za-z]+)"\)',
-                        href_value,
+                    print(log_line)
+                else:
+                    page_logger.info(f"Starting scrape for {name}, page {i}")
+                    # One round-trip for the whole page instead of several per row
+                    parse_start = time.perf_counter()
+                    lawTexts, allAssoc = parse_results_page(
+                        driver.page_source, law_type, page_logger
                     )
-                    if page:
-                        (
-                            journalYear,
-                            object["journalNum"],
-                            object["journalPage"],
-                            letter,
-                        ) = page.groups()
-
-                    id_element = row.find_element(By.XPATH, ".//td[1]/a")
-                    id_element_href = id_element.get_attribute("href")
-                    match = re.search(r"#(\d+)", id_element_href)
-                    id_number = match.group(1)
-                    object["id"] = int(id_number)
-
-                    next_siblings = []
-                    assocObject = {"assoc": "", "idOut": object["id"], "idsIn": []}
-
-                    log_line = f" ----------------- \n Getting siblings...\n"
+                    log_line = f"Parsed page {i} of {name} in {time.perf_counter() - parse_start:.3f}s"
                     page_logger.info(log_line)
-                    script = """
-                    var currentElement = arguments[0];
-                    var siblings = [];
-                    var nextSibling = currentElement.nextElementSibling;
-                    while (nextSibling) {
-                        if (nextSibling.getAttribute('bgcolor') === '#78a7b9') {
-                            break; // Stop if the sibling with the specified bgcolor is found
-                        }
-                        siblings.push(nextSibling); // Add the sibling to the list
-                        nextSibling = nextSibling.nextElementSibling; // Move to the next sibling
-                    }
-                    return siblings; // Return the collected siblings
-                    """
-
-                    # Execute the script and get the list of siblings until a specific bgcolor or the end
-                    siblings = driver.execute_script(script, row)
-                    log_line = f" ----------------- \n Got siblings...\n"
+                    log_line = f" \n \n \n ~~~~~~~~~~~~~~~~ \n lawTexts {lawTexts}\n"
                     page_logger.info(log_line)
-
-                    log_line = f" ----------------- \n Processing siblings...\n"
+                    log_line = f" \n \n \n ~~~~~~~~~~~~~~~~ \n length of lawTexts {len(lawTexts)}\n"
                     page_logger.info(log_line)
 
-                    assocObject = {"assoc": "", "idOut": object["id"], "idsIn": []}
-                    # Now 'siblings' will be a list of WebElement objects that you can loop through in Python
-                    for following_sibling in siblings:
-                        script = """
-                        var followingSibling = arguments[0];
-                        var tdElements = followingSibling.querySelectorAll('td');
-                        var result = {
-                            'siblingBgColor': followingSibling.getAttribute('bgcolor'),
-                            'tdElements': Array.from(tdElements).map(td => ({
-                                'colspan': td.getAttribute('colspan'),
-                                'bgcolor': td.getAttribute('bgcolor'),
-                                'text': td.querySelector('font') ? td.querySelector('font').textContent : '',
-                                'href': td.querySelector('a') ? td.querySelector('a').getAttribute('href') : ''
-                            }))
-                        };
-
-                        return result;                        
-                        """
-                        # Execute script
-                        script_result = driver.execute_script(script, following_sibling)
-
-                        # Process the result
-                        td_elements = script_result["tdElements"]
-
-                        if td_elements[0]["colspan"] == "6":
-                            next_siblings.append(following_sibling)
-                            log_line = (
-                                f"Added to next_siblings: {following_sibling.text}\n"
-                            )
-                            page_logger.info(log_line)
-
-                        elif td_elements[1]["colspan"] == "5":
-                            if assocObject["assoc"] != "":
-                                allAssoc.append(assocObject.copy())
-                            assocObject["assoc"] = td_elements[1]["text"]
-                            log_line = f"Association: {assocObject['assoc']}\n"
-                            page_logger.info(log_line)
-                        elif (
-                            td_elements[0]["colspan"] == "2"
-                            and len(td_elements) == 3
-                            and td_elements[2]["bgcolor"] == "#9ec7d7"
-                        ):
-                            id_element_href = td_elements[1]["href"]
-                            log_line = f"Association Law ID href: {id_element_href}\n"
-                            page_logger.info(log_line)
-                            match = re.search(r"#(\d+)", id_element_href)
-                            if match:
-                                id_number = match.group(1)
-                                assocObject["idsIn"].append(id_number)
-                    if assocObject["assoc"] != "":
-                        allAssoc.append(assocObject.copy())
-
-                    log_line = f" ----------------- \n Processed siblings...\n"
+                    log_line = f" \n \n \n ~~~~~~~~~~~~~~~~ \n allAssoc {allAssoc}\n"
                     page_logger.info(log_line)
-
-                    log_line = f" ----------------- \n Processing the law...\n"
+                    log_line = f" \n \n \n ~~~~~~~~~~~~~~~~ \n length of allAssoc {len(allAssoc)}\n"
                     page_logger.info(log_line)
 
-                    if len(next_siblings) == 4:
-                        var1 = next_siblings[0].text
-                        object["textType"] = law_type
-                        pattern = r"رقم (\S+)"
-                        match = re.search(pattern, var1)
-                        if match:
-                            textNumber = match.group(1)
-                        else:
-                            textNumber = ""
-                        object["textNumber"] = textNumber
-
-                        # Define the regular expression pattern
-                        pattern = r"في (\d+ [^\s]+ \d+)"
-                        # Use re.search to find the match
-                        match = re.search(pattern, var1)
-                        # Check if there is a match and extract the result
-                        if match:
-                            full_date_str = match.group(1)
-                            signatureDay, signatureMonth, signatureYear = (
-                                full_date_str.split()
-                            )
-                            signatureMonth = arabic_months[signatureMonth]
-
-                            object["signatureDate"] = (
-                                signatureYear
-                                + "-"
-                                + str(signatureMonth)
-                                + "-"
-                                + signatureDay
-                            )
-
-                            object["signatureDate"] = dt.fromisoformat(
-                                object["signatureDate"]
-                            )
-                        else:
-                            object["signatureDate"] = dt.fromisoformat("9999-12-31")
-
-                        object["ministry"] = next_siblings[1].text
-
-                        date = next_siblings[2].text
-                        # Define the regular expression pattern
-                        pattern = r"في (\d+ [^\s]+ \d+)"
-                        # Use re.search to find the match
-                        match = re.search(pattern, date)
-                        # Check if there is a match and extract the result
-                        if match:
-                            jornal_date_str = match.group(1)
-                            journalDay, journalMonth, _ = jornal_date_str.split()
-                            journalMonth = arabic_months[journalMonth]
-                            object["journalDate"] = (
-                                journalYear + "-" + str(journalMonth) + "-" + journalDay
-                            )
-
-                            object["journalDate"] = dt.fromisoformat(
-                                object["journalDate"]
-                            )
-                        else:
-                            object["journalDate"] = dt.fromisoformat("9999-12-31")
-
-                        object["content"] = next_siblings[3].text
-                        lawTexts.append(object.copy())
-
-                    elif len(next_siblings) == 3:
-                        var1 = next_siblings[0].text
-                        object["textType"] = law_type
-                        pattern = r"رقم (\S+)"
-                        match = re.search(pattern, var1)
-                        if match:
-                            textNumber = match.group(1)
-                        else:
-                            textNumber = ""
-                        object["textNumber"] = textNumber
-
-                        # Define the regular expression pattern
-                        pattern = r"في (\d+ [^\s]+ \d+)"
-                        # Use re.search to find the match
-                        match = re.search(pattern, var1)
-                        # Check if there is a match and extract the result
-                        if match:
-                            full_date_str = match.group(1)
-                            signatureDay, signatureMonth, signatureYear = (
-                                full_date_str.split()
-                            )
-                            signatureMonth = arabic_months[signatureMonth]
-
-                            object["signatureDate"] = (
-                                signatureYear
-                                + "-"
-                                + str(signatureMonth)
-                                + "-"
-                                + signatureDay
-                            )
-
-                            object["signatureDate"] = dt.fromisoformat(
-                                object["signatureDate"]
-                            )
-                        else:
-                            object["signatureDate"] = dt.fromisoformat("9999-12-31")
-
-                        date = next_siblings[1].text
-                        # Define the regular expression pattern
-                        pattern = r"في (\d+ [^\s]+ \d+)"
-                        # Use re.search to find the match
-                        match = re.search(pattern, date)
-                        # Check if there is a match and extract the result
-                        if match:
-                            jornal_date_str = match.group(1)
-                            journalDay, journalMonth, _ = jornal_date_str.split()
-                            journalMonth = arabic_months[journalMonth]
-                            object["journalDate"] = (
-                                journalYear + "-" + str(journalMonth) + "-" + journalDay
-                            )
-
-                            object["journalDate"] = dt.fromisoformat(
-                                object["journalDate"]
-                            )
-                        else:
-                            object["journalDate"] = dt.fromisoformat("9999-12-31")
-
-                        object["content"] = next_siblings[2].text
-                        lawTexts.append(object.copy())
-                    else:
-                        log_line = f" \n \n \n ERROR\n"
-                        page_logger.error(log_line)
-
-                    log_line = f" ----------------- \n Processed the law...\n"
+                    log_line = f" ----------------- \n Storing the laws in db...\n"
                     page_logger.info(log_line)
 
-                log_line = f" \n \n \n ~~~~~~~~~~~~~~~~ \n lawTexts {lawTexts}\n"
-                page_logger.info(log_line)
-                log_line = f" \n \n \n ~~~~~~~~~~~~~~~~ \n length of lawTexts {len(lawTexts)}\n"
-                page_logger.info(log_line)
-
-                log_line = f" \n \n \n ~~~~~~~~~~~~~~~~ \n allAssoc {allAssoc}\n"
-                page_logger.info(log_line)
-                log_line = f" \n \n \n ~~~~~~~~~~~~~~~~ \n length of allAssoc {len(allAssoc)}\n"
-                page_logger.info(log_line)
-
-                log_line = f" ----------------- \n Storing the laws in db...\n"
-                page_logger.info(log_line)
-
-                storeLawText(lawTexts, page_logger)
+                    stored_laws = storeLawText(lawTexts, page_logger)
 
-                log_line = f" ----------------- \n Stored the laws in db...\n"
-                page_logger.info(log_line)
+                    log_line = f" ----------------- \n Stored the laws in db...\n"
+                    page_logger.info(log_line)
 
-                log_line = f" ----------------- \n Storing the assoc in db...\n"
-                page_logger.info(log_line)
+                    log_line = f" ----------------- \n Storing the assoc in db...\n"
+                    page_logger.info(log_line)
 
-                storeLawAssociations(allAssoc, page_logger)
+                    stored_assoc = storeLawAssociations(allAssoc, page_logger)
+                    if not (stored_laws and stored_assoc):
+                        raise PageNotStored(f"Page {i} of {name} not stored")
+                    if i == last_page + 1:
+                        cursors.save(law_type, start_date, i, end_date)
+                        last_page = i
 
-                log_line = f" ----------------- \n Stored the assoc in db...\n"
-                page_logger.info(log_line)
+                    log_line = f" ----------------- \n Stored the assoc in db...\n"
+                    page_logger.info(log_line)
 
-                log_line = f" \n Finished scraping page {i} of {law_type} with {len(lawTexts)} law and {len(allAssoc)} assoc \n"
-                page_logger.info(log_line)
-                print(log_line)
+                    log_line = f" \n Finished scraping page {i} of {name} with {len(lawTexts)} law and {len(allAssoc)} assoc \n"
+                    page_logger.info(log_line)
+                    print(log_line)
 
                 if i != number_of_pages:
                     next_page_button = WebDriverWait(driver, 60).until(
@@ -554,8 +357,6 @@ def scrape_law_data(law_type, start_date):
                             (By.XPATH, "//a[@href=\"javascript:Sauter('a',3);\"]")
                         )
                     )
-                    next_page_button.click()
-
                     expected_number = ((i + 1) * 200) + 1
 
                     def check_page(driver):
@@ -583,130 +384,156 @@ def scrape_law_data(law_type, start_date):
                     page_logger.info(log_line)
                     main_logger.info(log_line)
                     print(log_line)
-                    WebDriverWait(driver, 180, 2).until(check_page)
+                    with get_limiter().request():
+                        next_page_button.click()
+                        WebDriverWait(driver, 180, 2).until(check_page)
                     log_line = f"Successfully navigated to page {i + 1}"
                     page_logger.info(log_line)
                     main_logger.info(log_line)
                     print(log_line)
 
+                page_loaded()
                 i = i + 1
 
+        except PageNotStored as e:
+            # scraped again from the cursor, the driver is fine
+            store_failures += 1
+            log_line = f"{e}, try {store_failures} of {MAX_STORE_TRIES}"
+            print(log_line)
+            main_logger.error(log_line)
+            if store_failures >= MAX_STORE_TRIES:
+                break
+
         except TimeoutException as e:
             log_line = f"TimeoutException: {e} RETRYING..."
             print(log_line)
             main_logger.error(log_line)
+            discard_driver()
 
         except Exception as e:
             log_line = f"ERROR !!!!: {e} RETRYING..."
             print(log_line)
             main_logger.error(log_line)
+            discard_driver()
         finally:
-            driver.quit()
             j += 1
 
-    log_line = f"PROGRAM ENDED AFTER {j + 1} TRIES FOR {law_type}!!!"
+    release_driver()
+    cursors.keep_or_clear(law_type, start_date, last_page, number_of_pages, end_date)
+    log_line = f"PROGRAM ENDED AFTER {j + 1} TRIES FOR {name}!!!"
     print(log_line)
     main_logger.info(log_line)
 
 
+def upsert_counts(written, total):
+    # xmax is 0 for the rows inserted by the statement
+    inserted = sum(1 for row in written if row.inserted)
+    return inserted, len(written) - inserted, total - len(written)
+
+
 def storeLawText(lawTexts, page_logger):
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    # one row per id, the last version of a law on the page wins
+    rows = {}
+    for law_text in lawTexts:
+        rows[law_text.id] = {
+            "id": law_text.id,
+            "text_type": law_text.text_type,
+            "text_number": law_text.text_number,
+            "journal_date": law_text.journal_date,
+            "journal_num": law_text.journal_num,
+            "journal_page": law_text.journal_page,
+            "signature_date": law_text.signature_date,
+            "ministry": law_text.ministry,
+            "content": law_text.content,
+            "field": "",
+            "long_content": "",
+            "page_fixed": False,
+        }
+    if not rows:
+        return True
+
+    statement = insert(LawText).values(list(rows.values()))
+    excluded = statement.excluded
+    updated_columns = [
+        "text_type",
+        "text_number",
+        "journal_date",
+        "journal_num",
+        "journal_page",
+        "signature_date",
+        "ministry",
+        "content",
+    ]
+    set_ = {column: excluded[column] for column in updated_columns}
+    # the page is the printed one again, fix_pages.py has to remap it
+    set_["page_fixed"] = case(
+        (LawText.journal_page.is_distinct_from(excluded.journal_page), False),
+        else_=LawText.page_fixed,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[LawText.id],
+        set_=set_,
+        # only the rows whose values changed are rewritten
+        where=or_(
+            *(
+                getattr(LawText, column).is_distinct_from(excluded[column])
+                for column in updated_columns
+            )
+        ),
+    ).returning(LawText.id, literal_column("xmax = 0").label("inserted"))
+
     try:
-        for law_text in lawTexts:
-            # Check if the law text already exists
-            existing_law_text = session.query(LawText).get(law_text["id"])
-            if existing_law_text:
-                # Update existing record
-                existing_law_text.text_type = law_text["textType"]
-                existing_law_text.text_number = law_text["textNumber"]
-                existing_law_text.journal_date = law_text["journalDate"]
-                existing_law_text.journal_num = law_text["journalNum"]
-                existing_law_text.journal_page = law_text["journalPage"]
-                existing_law_text.signature_date = law_text["signatureDate"]
-                existing_law_text.ministry = law_text["ministry"]
-                existing_law_text.content = law_text["content"]
-            else:
-                # Insert new record
-                new_law_text = LawText(
-                    id=law_text["id"],
-                    text_type=law_text["textType"],
-                    text_number=law_text["textNumber"],
-                    journal_date=law_text["journalDate"],
-                    journal_num=law_text["journalNum"],
-                    journal_page=law_text["journalPage"],
-                    signature_date=law_text["signatureDate"],
-                    ministry=law_text["ministry"],
-                    content=law_text["content"],
-                )
-                session.add(new_law_text)
-        session.commit()
-        log_line = f" ----------------- \n lawTexts stored in db successfully and committed...\n"
+        with engine.begin() as connection:
+            written = connection.execute(statement).all()
+        inserted, updated, unchanged = upsert_counts(written, len(rows))
+        log_line = f" ----------------- \n lawTexts stored in db successfully and committed: {inserted} inserted, {updated} updated, {unchanged} unchanged...\n"
         page_logger.info(log_line)
+        return True
     except Exception as e:
-        session.rollback()
         log_line = f"Error inserting/updating law text: {e}"
         page_logger.error(log_line)
-    finally:
-        session.close()
+        return False
 
 
 def storeLawAssociations(associations, page_logger):
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    try:
-        for assoc_data in associations:
-            # Directly attempt to retrieve the specific association using both parts of the composite key
-            existing_assoc = session.query(Association).get(
-                {"id_out": assoc_data["idOut"], "assoc_nom": assoc_data["assoc"]}
-            )
+    rows = {}
+    for assoc_data in associations:
+        rows[(assoc_data.id_out, assoc_data.name)] = {
+            "id_out": assoc_data.id_out,
+            "assoc_nom": assoc_data.name,
+            "ids_in": assoc_data.ids_in,
+        }
+    if not rows:
+        return True
+
+    statement = insert(Association).values(list(rows.values()))
+    excluded = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=[Association.id_out, Association.assoc_nom],
+        set_={"ids_in": excluded.ids_in},
+        where=Association.ids_in.is_distinct_from(excluded.ids_in),
+    ).returning(Association.id_out, literal_column("xmax = 0").label("inserted"))
 
-            if existing_assoc:
-                # If the association exists, update the ids_in
-                existing_assoc.ids_in = assoc_data["idsIn"]
-            else:
-                # If no such association exists, create a new one
-                new_assoc = Association(
-                    id_out=assoc_data["idOut"],
-                    assoc_nom=assoc_data["assoc"],
-                    ids_in=assoc_data["idsIn"],
-                )
-                session.add(new_assoc)
-
-        # Commit the session once all associations have been processed
-        session.commit()
-        log_line = f" ----------------- \n associations stored in db successfully and committed...\n"
+    try:
+        # the whole page is written in one transaction, nothing partial on errors
+        with engine.begin() as connection:
+            written = connection.execute(statement).all()
+        inserted, updated, unchanged = upsert_counts(written, len(rows))
+        log_line = f" ----------------- \n associations stored in db successfully and committed: {inserted} inserted, {updated} updated, {unchanged} unchanged...\n"
         page_logger.info(log_line)
+        return True
     except Exception as e:
-        # If any exception occurs, rollback the session to avoid partial commits
-        session.rollback()
         log_line = f"Error in storing/updating associations: {e}"
         page_logger.error(log_line)
-    finally:
-        # Ensure the session is closed properly in a finally block
-        session.close()
-
-
-if __name__ == "__main__":
-    
-
-    # Create database tables
-    # DONT FORGET TO CHECK IF THE TABLE EXISTS OR NOT BEFORE CREATING IT
-    Base.metadata.create_all(engine)
-    
-    Session = sessionmaker(bind=engine)
-    session = Session()
+        return False
 
-    start_date = session.query(LastScrapingDate).first().newspapers_scraper
 
-    # Initialize ChromeOptions
-    options = Options()
-    options.add_argument("--disable-gpu")
-    options.add_argument("--headless=new")
-    driver = webdriver.Chrome(options=options)
+def get_law_types_selenium():
+    driver = get_driver()
 
     # Open the website
-    driver.get("https://www.joradp.dz/HAR/Index.htm")
+    with get_limiter().request():
+        driver.get("https://www.joradp.dz/HAR/Index.htm")
 
     # Switch to the frame with src="ATitre.htm"
     driver.switch_to.frame(driver.find_element(By.XPATH, '//frame[@src="ATitre.htm"]'))
@@ -724,7 +551,8 @@ if __name__ == "__main__":
             (By.XPATH, "/html/body/div/table[2]/tbody/tr/td[3]/a")
         )
     )
-    search_link.click()
+    with get_limiter().request():
+        search_link.click()
 
     # Switch back to the default content before switching to another frame
     driver.switch_to.default_content()
@@ -741,19 +569,125 @@ if __name__ == "__main__":
     options = select_object.options
     for option in options:
         law_types.append(option.text)
-    law_types = law_types[1:]
-    print(law_types)
-    main_logger.info(f"law_types : {law_types}")
-    driver.quit()
+    # the workers start their own drivers
+    quit_driver()
+    return law_types
+
+
+# Types with more results than this are split into journal date windows
+SPLIT_THRESHOLD = 10 * RESULTS_PER_PAGE
+MIN_WINDOW_DAYS = 31
+
+
+def split_law_type(client, law_type, start_date, end_date, count):
+    """Bisects the journal date window until every part has at most
+    SPLIT_THRESHOLD results, returns [(count, start date, end date)].
+    end_date None is an open end, kept on the last window so that nothing
+    dated after today is missed"""
+    span_end = end_date or dt.today()
+    if count <= SPLIT_THRESHOLD or (span_end - start_date).days < 2 * MIN_WINDOW_DAYS:
+        return [(count, start_date, end_date)]
+
+    middle = start_date + (span_end - start_date) // 2
+    windows = []
+    for window_start, window_end in (
+        (start_date, middle),
+        (middle + timedelta(days=1), end_date),
+    ):
+        window_count = client.count("znat", law_type, window_start, window_end)
+        if window_count is None:
+            # scraped whole rather than dropped
+            main_logger.warning(
+                f"{law_type} {window_start} - {window_end}: results counter not found, unknown size"
+            )
+            windows.append((None, window_start, window_end))
+        elif window_count > 0:
+            windows += split_law_type(
+                client, law_type, window_start, window_end, window_count
+            )
+    found = sum(window[0] for window in windows if window[0] is not None)
+    if found != count and all(window[0] is not None for window in windows):
+        main_logger.warning(
+            f"{law_type} {start_date} - {end_date}: {count} results but {found} in the windows"
+        )
+    return windows
+
+
+def plan_work_units(client, law_types, start_date):
+    """(law type, start date, end date) units for the pool, the large types
+    split into date windows, sorted by estimated number of results so that
+    the biggest units start first and the small ones fill the gaps"""
+    units = []
+    for law_type in law_types:
+        try:
+            count = client.count("znat", law_type, start_date)
+            if count is None:
+                main_logger.warning(f"{law_type}: results counter not found, unknown size")
+                windows = [(None, start_date, None)]
+            elif count == 0:
+                main_logger.info(f"{law_type}: no laws since {start_date}")
+                continue
+            else:
+                windows = split_law_type(client, law_type, start_date, None, count)
+        except Exception as e:
+            main_logger.error(f"Could not estimate the size of {law_type}: {e}")
+            # unknown size, scheduled first as a single unit
+            windows = [(None, start_date, None)]
+        for count, window_start, window_end in windows:
+            units.append((count, law_type, window_start, window_end))
+        main_logger.info(f"{law_type}: {[window[0] for window in windows]} results")
+
+    units.sort(key=lambda unit: float("inf") if unit[0] is None else unit[0], reverse=True)
+    return [(law_type, window_start, window_end) for _, law_type, window_start, window_end in units]
+
+
+if __name__ == "__main__":
+    
+
+    # Create database tables
+    # DONT FORGET TO CHECK IF THE TABLE EXISTS OR NOT BEFORE CREATING IT
+    Base.metadata.create_all(engine)
+    CursorBase.metadata.create_all(engine)
+    
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    start_date = session.query(LastScrapingDate).first().newspapers_scraper
+
+    client = JoradpClient(logger=main_logger)
+    try:
+        law_types = client.select_options("znat")[1:]
+        print(law_types)
+        main_logger.info(f"law_types : {law_types}")
+        work_units = plan_work_units(client, law_types, start_date)
+    except Exception as e:
+        main_logger.error(f"HTTP client failed to read the law types: {e}")
+        law_types = get_law_types_selenium()[1:]
+        print(law_types)
+        main_logger.info(f"law_types : {law_types}")
+        # no estimates without the http client, one unit per type
+        work_units = [(law_type, start_date, None) for law_type in law_types]
+    finally:
+        # the workers open their own connections
+        client.close()
+    main_logger.info(f"work units : {work_units}")
 
     # law_types = ['أمر', 'منشور', 'منشور وزاري مشترك', 'لائحة', 'مداولة', 'مداولة م-أ-للدولة', 'مرسوم', 'مرسوم تنفيذي', 'مرسوم تشريعي', 'مرسوم رئاسي', 'مقرر', 'مقرر وزاري مشترك', 'إعلان', 'نظام', 'اتفاقية', 'تصريح', 'تقرير', 'تعليمة', 'تعليمة وزارية مشتركة', 'جدول', 'رأي', 'قانون', 'قانون عضوي', 'قرار', 'قرار ولائي', 'قرار وزاري مشترك']
 
-    law_types_iterator = iter(law_types)
-    with multiprocessing.Pool(processes=3) as pool:
-        for result in pool.starmap(
-            scrape_law_data, zip(law_types_iterator, itertools.repeat(start_date))
-        ):
+    # the workers share the joradp.dz budget, the limiter decides how many
+    # of them are loading a page at the same time
+    limiter = get_limiter()
+    with multiprocessing.Pool(
+        processes=MAX_CONCURRENCY, initializer=init_worker, initargs=(limiter,)
+    ) as pool:
+        # chunksize 1: the units are handed out one by one, largest first
+        for result in pool.starmap(scrape_law_data, work_units, chunksize=1):
             pass
+        # let the workers exit normally so that they quit their chrome
+        pool.close()
+        pool.join()
+    main_logger.info(f"joradp.dz throttle: {limiter.stats()}")
+    limiter.save()
     
     last_scraping_date = session.query(LastScrapingDate).first()
     last_scraping_date.laws_metadata_scraper = dt.today()
@@ -1,14 +1,25 @@
 import scrapy
 from scrapy import signals
-import requests
-from tqdm import tqdm
 import os
-from sqlalchemy import create_engine, Column, String,Integer, Date
+from sqlalchemy import create_engine, Column, String,Integer, Date, or_, literal_column
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 import logging
 from datetime import date
 from dotenv import load_dotenv
+from twisted.internet.threads import deferToThread
+import joradp_throttle  # needed by DOWNLOADER_MIDDLEWARES
+from pdf_downloader import (
+    build_jobs,
+    load_manifest,
+    manifest_entry,
+    manifest_key,
+    request_headers,
+    save_manifest,
+    without_partial,
+    write_pdf,
+)
 
 
 load_dotenv()
@@ -71,36 +82,192 @@ engine = create_engine(DB_URL)
 Session = sessionmaker(bind=engine)
 session = Session()
 
-def storeOfficialNewspaper(newsPaper):
-    try:
-        # Check if the law text already exists
-        existing_news_paper = session.query(Newspaper).get(newsPaper["id"])
-        if existing_news_paper:
-            # Update existing record
-            existing_news_paper.year = newsPaper["year"]
-            existing_news_paper.number = newsPaper["number"]
-            existing_news_paper.link = newsPaper["link"]
-        else:
-            # Insert new record
-            new_news_paper = Newspaper(
-                id=newsPaper["id"],
-                year=newsPaper["year"],
-                number=newsPaper["number"],
-                link=newsPaper["link"]
+class NewspaperWriter:
+    """Collects official_newspaper rows and upserts them in batches with a
+    single INSERT ... ON CONFLICT (id) DO UPDATE per batch"""
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self.rows = {}
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+
+    def add(self, newsPaper):
+        # a batch can't touch the same id twice, the last version wins
+        self.rows[newsPaper["id"]] = newsPaper
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        rows = list(self.rows.values())
+        self.rows = {}
+
+        statement = insert(Newspaper).values(rows)
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=[Newspaper.id],
+            set_={
+                "year": excluded.year,
+                "number": excluded.number,
+                "link": excluded.link,
+            },
+            # rows whose values did not change are left alone
+            where=or_(
+                Newspaper.year.is_distinct_from(excluded.year),
+                Newspaper.number.is_distinct_from(excluded.number),
+                Newspaper.link.is_distinct_from(excluded.link),
+            ),
+        ).returning(Newspaper.id, literal_column("xmax = 0").label("inserted"))
+
+        try:
+            with engine.begin() as connection:
+                written = connection.execute(statement).all()
+        except Exception as e:
+            main_logger.info(f"Error inserting/updating newspapers: {e}")
+            return
+
+        inserted = sum(1 for row in written if row.inserted)
+        self.inserted += inserted
+        self.updated += len(written) - inserted
+        self.unchanged += len(rows) - len(written)
+        main_logger.info(
+            f"{len(rows)} newspapers upserted in the db: {inserted} inserted, "
+            f"{len(written) - inserted} updated, {len(rows) - len(written)} unchanged"
+        )
+
+
+class JournalPdfPipeline:
+    """Downloads the journals yielded by parse_year through scrapy's downloader
+    (so they overlap the index crawl) and batches the official_newspaper upserts"""
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.manifest = {}
+        self.writer = NewspaperWriter(
+            batch_size=crawler.settings.getint("NEWSPAPERS_BATCH_SIZE", 500)
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def open_spider(self, spider):
+        self.manifest = load_manifest()
+
+    def close_spider(self, spider):
+        self.writer.flush()
+        save_manifest(self.manifest)
+        self.stats.set_value("joradp/newspapers/inserted", self.writer.inserted)
+        self.stats.set_value("joradp/newspapers/updated", self.writer.updated)
+        self.stats.set_value("joradp/newspapers/unchanged", self.writer.unchanged)
+        main_logger.info(
+            f"official_newspaper: {self.writer.inserted} inserted, "
+            f"{self.writer.updated} updated, {self.writer.unchanged} unchanged"
+        )
+
+    def process_item(self, item, spider):
+        return self.fetch(item, self.manifest.get(manifest_key(item)))
+
+    def fetch(self, item, entry):
+        request = scrapy.Request(
+            item["url"],
+            headers=request_headers(entry, item["path"]),
+            meta={"handle_httpstatus_all": True},
+            dont_filter=True,
+        )
+        dfd = self.crawler.engine.download(request)
+        dfd.addCallback(self.pdf_downloaded, item, entry)
+        dfd.addErrback(self.pdf_failed, item)
+        return dfd
+
+    def pdf_downloaded(self, response, item, entry):
+        if response.status == 304:
+            self.stats.inc_value("joradp/pdf/unchanged")
+            main_logger.info(f"Unchanged: {item['year']}_{item['number']}.pdf")
+            return self.store(item)
+        if response.status == 416:
+            # stale .part left by an interrupted pdf_downloader.py run, the
+            # journal is downloaded again from the start
+            part_path = f"{item['path']}.part"
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            entry = without_partial(entry)
+            self.manifest[manifest_key(item)] = entry
+            self.stats.inc_value("joradp/pdf/restarted")
+            main_logger.info(f"Restarting: {item['year']}_{item['number']}.pdf")
+            return self.fetch(item, entry)
+        if response.status not in (200, 206):
+            self.stats.inc_value(f"joradp/pdf/status_{response.status}")
+            main_logger.info(
+                f"Failed to download {item['year']}_{item['number']}.pdf. Status Code: {response.status}"
             )
-            session.add(new_news_paper)
-        session.commit()
-    except Exception as e:
-        session.rollback()
-        main_logger.info(f"Error inserting/updating newspaper: {e}")
-    finally:
-        session.close()
+            return item
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        etag = etag.decode() if etag else None
+        last_modified = last_modified.decode() if last_modified else None
+
+        # hashing / writing the pdf must not block the reactor
+        dfd = deferToThread(
+            write_pdf, item, entry, response.status == 206, [response.body]
+        )
+        dfd.addCallback(self.pdf_written, item, etag, last_modified)
+        return dfd
+
+    def pdf_written(self, written, item, etag, last_modified):
+        digest, size, changed = written
+        self.manifest[manifest_key(item)] = manifest_entry(
+            item, etag, last_modified, digest
+        )
+        if changed:
+            self.stats.inc_value("joradp/pdf/downloaded")
+            self.stats.inc_value("joradp/pdf/bytes", size)
+            main_logger.info(f"Downloaded: {item['year']}_{item['number']}.pdf")
+        else:
+            self.stats.inc_value("joradp/pdf/unchanged")
+            main_logger.info(f"Unchanged: {item['year']}_{item['number']}.pdf")
+        return self.store(item)
+
+    def pdf_failed(self, failure, item):
+        self.stats.inc_value("joradp/pdf/failed")
+        main_logger.info(
+            f"Failed to download {item['year']}_{item['number']}.pdf: {failure.getErrorMessage()}"
+        )
+        return item
+
+    def store(self, item):
+        self.writer.add(
+            {
+                "id": f"{item['year']}{int(item['number'])}",
+                "year": f"{item['year']}",
+                "number": f"{int(item['number'])}",
+                "link": f"{item['url']}"
+            }
+        )
+        return item
 
 
 class JoradpSpider(scrapy.Spider):
     data = {}
     name = "joradp"
     start_urls = ["https://www.joradp.dz/HAR/Index.htm"]
+    custom_settings = {
+        "ITEM_PIPELINES": {"newspapers_scraper.JournalPdfPipeline": 300},
+        # stay polite to joradp.dz, the pdfs and the index draw from the
+        # budget shared with the other scrapers
+        "DOWNLOADER_MIDDLEWARES": {"joradp_throttle.ThrottleMiddleware": 650},
+        "CONCURRENT_REQUESTS_PER_DOMAIN": 4,
+        "RETRY_TIMES": 3,
+        "DOWNLOAD_TIMEOUT": 180,
+        "DOWNLOAD_WARNSIZE": 0,
+        "LOG_LEVEL": "INFO",
+        "NEWSPAPERS_BATCH_SIZE": 500,
+    }
 
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
@@ -151,8 +318,11 @@ class JoradpSpider(scrapy.Spider):
         year_data = {year: [option.attrib["value"] for option in options]}
         self.data.update(year_data)
 
+        # the pipeline starts downloading this year's journals right away
+        for job in build_jobs(year_data):
+            yield job
+
     def spider_closed(self, spider):
-        base_url = "https://www.joradp.dz/FTP/JO-ARABE/"
         self.data = dict(sorted(self.data.items()))
         with open("pdf_numbers.txt", "w") as f:
             f.write(f"{self.data}\n")
@@ -160,47 +330,3 @@ class JoradpSpider(scrapy.Spider):
         last_scraping_date = session.query(LastScrapingDate).first()
         last_scraping_date.newspapers_scraper = date.today()
         session.commit()
-
-        for year, numbers in self.data.items():
-            max = numbers[0]
-            for number in tqdm(numbers, desc=f"Downloading PDFs for {year}"):
-                if int(max) > 99:
-                    if int(year) == 2021:
-                        pdf_url = f"{base_url}{year}/A{year}0{number}.pdf"
-                    else:
-                        pdf_url = f"{base_url}{year}/A{year}{number}.pdf"
-                else:
-                    pdf_url = f"{base_url}{year}/A{year}0{number}.pdf"
-
-                response = requests.get(pdf_url, stream=True,verify=False)
-
-                if response.status_code == 200:
-                    local_directory = f"joradp_pdfs/{year}"
-                    local_file_path = f"{local_directory}/{year}_{int(number)}.pdf"
-
-                    # Create directory if it doesn't exist
-                    os.makedirs(local_directory, exist_ok=True)
-
-                    with open(local_file_path, "wb") as pdf_file:
-                        for chunk in response.iter_content(chunk_size=128):
-                            pdf_file.write(chunk)
-
-                    main_logger.info(f"Downloaded: {year}_{number}.pdf")
-
-                    # inserting into the database
-                    newspaper = {
-                        "id": f"{year}{int(number)}",
-                        "year": f"{year}",
-                        "number": f"{int(number)}",
-                        "link": f"{pdf_url}"
-                    }
-
-                    storeOfficialNewspaper(newsPaper=newspaper)
-
-                    main_logger.info(
-                        f"{newspaper} has been inserted in the db")
-
-                else:
-                    main_logger.info(
-                        f"Failed to download {year}_{number}.pdf. Status Code: {response.status_code}"
-                    )
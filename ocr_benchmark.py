@@ -0,0 +1,43 @@
+import sys
+import time
+from ocr_engine import ENGINES, close_engines, get_engine, tesserocr
+from ocr_images import render_page
+from page_chunks import page_count
+
+
+# Pages / second of the OCR backends on the first pages of a journal, one
+# worker, engine start up included:
+# python3 ocr_benchmark.py joradp_pdfs/1975/1975_12.pdf [pages]
+
+PAGES = 10
+
+
+def benchmark(images, name, lang="ara"):
+    start = time.perf_counter()
+    texts = [get_engine(lang, name).recognize(image)[0] for image in images]
+    elapsed = time.perf_counter() - start
+    close_engines()
+    return texts, elapsed
+
+
+if __name__ == "__main__":
+    pdf_path = sys.argv[1]
+    pages = min(int(sys.argv[2]) if len(sys.argv) > 2 else PAGES, page_count(pdf_path))
+
+    # rendered once, only the OCR is measured
+    images = [render_page(pdf_path, page_number) for page_number in range(1, pages + 1)]
+
+    names = [name for name in ENGINES if name != "tesserocr" or tesserocr is not None]
+    results = {}
+    for name in names:
+        texts, elapsed = benchmark(images, name)
+        results[name] = texts
+        print(f"{name:<12} {pages / elapsed:6.2f} pages/s ({elapsed / pages:.2f} s/page)")
+
+    if len(results) > 1:
+        reference = results["pytesseract"]
+        for name, texts in results.items():
+            different = sum(1 for a, b in zip(texts, reference) if a.strip() != b.strip())
+            print(f"{name:<12} {different} of {pages} pages differ from pytesseract")
+    if tesserocr is None:
+        print("tesserocr is not installed, only pytesseract was measured")
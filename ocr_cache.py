@@ -0,0 +1,128 @@
+import hashlib
+import threading
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime, select, update, text
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.dialects.postgresql import insert
+
+
+# OCR results addressed by the content of the page: same pixels, same OCR
+# backend, tesseract version, lang and config -> same text. A re-rendered
+# journal, a removed {page}.txt or a cover page seen in every journal is not
+# OCRed again.
+
+# total size of the cached texts, the least recently used are evicted above it
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+# eviction goes down to this share of MAX_CACHE_BYTES
+EVICT_TO = 0.9
+# stores between two size checks
+EVICT_EVERY = 500
+
+Base = declarative_base()
+
+
+class OcrCacheEntry(Base):
+    __tablename__ = "ocr_cache"
+    key = Column(String, primary_key=True)
+    text = Column(Text)
+    confidence = Column(Float)
+    size = Column(Integer)
+    last_used = Column(DateTime, index=True)
+
+
+def cache_key(image, engine):
+    """sha256 of the page pixels and of the engine and its settings, the
+    backends don't give the same text for the same config"""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    digest.update(f":{engine.name}:{engine.version}:{engine.lang}:{engine.config}".encode())
+    return digest.hexdigest()
+
+
+class OcrCache:
+    def __init__(self, db_engine, max_bytes=MAX_CACHE_BYTES):
+        self.db_engine = db_engine
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evicted = 0
+        Base.metadata.create_all(db_engine)
+
+    def get(self, key):
+        """(text, confidence) or None"""
+        with self.db_engine.begin() as connection:
+            row = connection.execute(
+                select(OcrCacheEntry.text, OcrCacheEntry.confidence).where(
+                    OcrCacheEntry.key == key
+                )
+            ).first()
+            if row is not None:
+                connection.execute(
+                    update(OcrCacheEntry)
+                    .where(OcrCacheEntry.key == key)
+                    .values(last_used=datetime.now())
+                )
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row.text, row.confidence
+
+    def put(self, key, page_text, confidence):
+        statement = insert(OcrCacheEntry).values(
+            key=key,
+            text=page_text,
+            confidence=confidence,
+            size=len(page_text.encode("utf-8")),
+            last_used=datetime.now(),
+        )
+        statement = statement.on_conflict_do_nothing(index_elements=[OcrCacheEntry.key])
+        with self.db_engine.begin() as connection:
+            connection.execute(statement)
+        with self._lock:
+            self.stores += 1
+            check = self.stores % EVICT_EVERY == 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        """Deletes the least recently used entries beyond EVICT_TO x max_bytes
+        once the cache is over max_bytes"""
+        with self.db_engine.begin() as connection:
+            total = connection.execute(
+                text("SELECT coalesce(sum(size), 0) FROM ocr_cache")
+            ).scalar()
+            if total <= self.max_bytes:
+                return 0
+            evicted = connection.execute(
+                text(
+                    """
+                    DELETE FROM ocr_cache WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, sum(size) OVER (ORDER BY last_used DESC, key) AS kept
+                            FROM ocr_cache
+                        ) AS entries
+                        WHERE kept > :limit
+                    )
+                    """
+                ),
+                {"limit": int(self.max_bytes * EVICT_TO)},
+            ).rowcount
+        with self._lock:
+            self.evicted += evicted
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "stores": self.stores,
+                "evicted": self.evicted,
+            }
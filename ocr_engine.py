@@ -0,0 +1,129 @@
+import os
+import csv
+import tempfile
+import threading
+import subprocess
+import pytesseract
+from cpu_scheduler import pin_threads
+
+# before tesserocr loads libtesseract and its OpenMP runtime, which read the
+# thread limits once
+pin_threads()
+
+try:
+    # keeps tesseract and its traineddata loaded in the process, images are
+    # passed in memory (pip install tesserocr, needs libtesseract)
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+# One engine per OCR worker thread: tesserocr releases the GIL while
+# recognizing, so the threads of the OCR stage run in parallel
+
+# config of the recognition, part of the OCR cache key
+CONFIG = "psm=3"
+
+_local = threading.local()
+_engines = []
+_engines_lock = threading.Lock()
+
+
+class TesserocrEngine:
+    """Loaded once, then every page is recognized in memory"""
+
+    name = "tesserocr"
+    config = CONFIG
+
+    def __init__(self, lang="ara"):
+        self.lang = lang
+        self.api = tesserocr.PyTessBaseAPI(lang=lang, psm=tesserocr.PSM.AUTO)
+        self.version = tesserocr.tesseract_version().split()[1]
+
+    def recognize(self, image):
+        """(text, mean word confidence 0-100)"""
+        self.api.SetImage(image)
+        text = self.api.GetUTF8Text()
+        return text, float(self.api.MeanTextConf())
+
+    def close(self):
+        self.api.End()
+
+
+class PytesseractEngine:
+    """One tesseract process per page, the image goes through a temp file"""
+
+    name = "pytesseract"
+    config = CONFIG
+
+    def __init__(self, lang="ara"):
+        self.lang = lang
+        self.version = str(pytesseract.get_tesseract_version())
+
+    def recognize(self, image):
+        """(text, mean word confidence 0-100), the text and the word boxes
+        come from the same tesseract run (txt + tsv outputs)"""
+        with tempfile.TemporaryDirectory() as directory:
+            image_path = os.path.join(directory, "page.png")
+            image.save(image_path)
+            output_base = os.path.join(directory, "page")
+            subprocess.run(
+                [
+                    pytesseract.pytesseract.tesseract_cmd,
+                    image_path,
+                    output_base,
+                    "-l", self.lang,
+                    "--psm", "3",
+                    "txt",
+                    "tsv",
+                ],
+                capture_output=True,
+                check=True,
+            )
+            with open(f"{output_base}.txt", "r", encoding="utf-8") as f:
+                text = f.read()
+            with open(f"{output_base}.tsv", "r", encoding="utf-8") as f:
+                confidences = [
+                    float(row["conf"])
+                    for row in csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+                    if (row.get("text") or "").strip() and float(row["conf"]) >= 0
+                ]
+        confidence = sum(confidences) / len(confidences) if confidences else 0.0
+        return text, confidence
+
+    def close(self):
+        pass
+
+
+ENGINES = {
+    "tesserocr": TesserocrEngine,
+    "pytesseract": PytesseractEngine,
+}
+
+
+def default_engine():
+    return "tesserocr" if tesserocr is not None else "pytesseract"
+
+
+def get_engine(lang="ara", name=None):
+    """The engine of the calling thread, created on first use"""
+    name = name or default_engine()
+    engines = getattr(_local, "engines", None)
+    if engines is None:
+        engines = _local.engines = {}
+    key = (name, lang)
+    if key not in engines:
+        engine = ENGINES[name](lang=lang)
+        engines[key] = engine
+        with _engines_lock:
+            _engines.append(engine)
+    return engines[key]
+
+
+def close_engines():
+    """Frees the loaded engines, once the OCR is done"""
+    with _engines_lock:
+        for engine in _engines:
+            engine.close()
+        _engines.clear()
+    _local.__dict__.clear()
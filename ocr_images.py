@@ -1,43 +1,252 @@
 import os
+import io
+import json
+import threading
+import subprocess
 from PIL import Image
-import pytesseract
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed, wait
+from sqlalchemy import create_engine
+from dotenv import load_dotenv
+from cpu_scheduler import CpuScheduler
+from ocr_engine import close_engines, get_engine
+from ocr_cache import OcrCache, cache_key
+from law_pages import pages_in, required_pages
+from text_layer import arabic_ratio
+from preprocess import PreprocessStats, preprocess
+from page_chunks import JournalProgress, interleave, journal_key, journal_pdfs, missing_pages, page_chunks, txt_dir
 
-def process_image(img_path, lang='ara'):
+load_dotenv()
+
+# Pages are rendered by pdftoppm straight into memory (grayscale PGM, no
+# compression to undo) and OCRed, only the {page}.txt files touch the disk
+# Pages are OCRed at LOW_DPI first, the ones tesseract is unsure of (old
+# scans mostly) are rendered again at HIGH_DPI and OCRed again
+LOW_DPI = 150
+HIGH_DPI = 300
+# mean word confidence (0-100) and share of arabic letters under which the
+# low DPI text is not kept
+MIN_CONFIDENCE = 70
+MIN_ARABIC_RATIO = 0.6
+RENDER_TIMEOUT = 300
+# a chunk is OCRed by one worker, small enough for the last chunks of a
+# batch not to leave the other workers idle for long
+CHUNK_PAGES = 4
+# chunks between two prints of the scheduler stats
+STATS_EVERY = 50
+
+
+def render_page(pdf_path, page_number, dpi=LOW_DPI):
+    """One page of the pdf as a grayscale PIL image"""
+    result = subprocess.run(
+        [
+            "pdftoppm",
+            "-gray",
+            "-r", str(dpi),
+            "-f", str(page_number),
+            "-l", str(page_number),
+            "-singlefile",
+            pdf_path,
+        ],
+        capture_output=True,
+        timeout=RENDER_TIMEOUT,
+        check=True,
+    )
+    return Image.open(io.BytesIO(result.stdout))
+
+
+def write_text(txt_file_path, text):
+    # Save the extracted text to a .txt file, written under another name
+    # first so that an interrupted run never leaves a partial page
+    os.makedirs(os.path.dirname(txt_file_path), exist_ok=True)
+    with open(f"{txt_file_path}.part", 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(f"{txt_file_path}.part", txt_file_path)
+
+
+def write_page_info(info_file_path, info):
+    # {page}.json next to {page}.txt: confidence, arabic ratio and DPI of the
+    # kept text
+    write_text(info_file_path, json.dumps(info))
+
+
+class DpiStats:
+    """Pages OCRed at low DPI only / again at high DPI"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.low = 0
+        self.high = 0
+
+    def add(self, dpi):
+        with self._lock:
+            if dpi == HIGH_DPI:
+                self.high += 1
+            else:
+                self.low += 1
+
+    def stats(self):
+        with self._lock:
+            pages = self.low + self.high
+            return {
+                "low_dpi": self.low,
+                "high_dpi": self.high,
+                "high_dpi_rate": round(self.high / pages, 3) if pages else 0.0,
+            }
+
+
+dpi_stats = DpiStats()
+preprocess_stats = PreprocessStats()
+
+
+def clean_page(pdf_path, page_number, image):
+    """The page cropped, straightened and binarized for the OCR, as rendered
+    if the preprocessing fails"""
+    try:
+        cleaned, info = preprocess(image)
+    except Exception as e:
+        print(f"Error preprocessing page {page_number} of {pdf_path}: {e}")
+        return image
+    preprocess_stats.add(info)
+    reduction = 1 - info["pixels_after"] / info["pixels_before"]
+    print(
+        f"Preprocessed page {page_number} of {pdf_path}: {reduction:.0%} fewer pixels, "
+        f"skew {info['skew']:+.2f}, {1000 * info['seconds']:.0f} ms"
+    )
+    return cleaned
+
+
+def needs_high_dpi(text, confidence):
+    return confidence < MIN_CONFIDENCE or arabic_ratio(text) < MIN_ARABIC_RATIO
+
+
+def recognize(cache, image, lang='ara'):
+    """(text, confidence) of the page, from the cache when the same pixels
+    were already OCRed with the same settings"""
+    # engine of this OCR worker, loaded once (tesserocr if installed)
+    engine = get_engine(lang)
+    key = cache_key(image, engine)
     try:
-        # Extract sequence number from image file name
-        sequence_number = int(os.path.basename(img_path).split("-")[-1].split(".")[0])
-        
-        # Construct text file path based on sequence number
-        txt_file_path = os.path.join(os.path.dirname(img_path), f"{sequence_number}.txt")
+        cached = cache.get(key)
+    except Exception as e:
+        print(f"OCR cache lookup failed: {e}")
+        cached = None
+    if cached is not None:
+        return cached
 
-        # Check if text path already exists
-        if os.path.exists(txt_file_path):
-            print(f"Text file already exists for {img_path}")
-            return
+    text, confidence = engine.recognize(image)
+    try:
+        cache.put(key, text, confidence)
+    except Exception as e:
+        print(f"OCR cache store failed: {e}")
+    return text, confidence
 
-        # Perform OCR using pytesseract
-        text = pytesseract.image_to_string(Image.open(img_path), lang=lang)
 
-        # Save the extracted text to a .txt file
-        with open(txt_file_path, 'w', encoding='utf-8') as f:
-            f.write(text)
+def ocr_page(scheduler, cache, pdf_path, page_number, image, lang='ara'):
+    """OCR stage: one page rendered at LOW_DPI to its {page}.txt, through
+    HIGH_DPI if the low DPI text is poor"""
+    try:
+        image = clean_page(pdf_path, page_number, image)
+        text, confidence = recognize(cache, image, lang=lang)
+        dpi = LOW_DPI
+        if needs_high_dpi(text, confidence):
+            # rendered by this worker, the page is already counted in
+            # pending_pages
+            image = clean_page(pdf_path, page_number, render_page(pdf_path, page_number, dpi=HIGH_DPI))
+            high_text, high_confidence = recognize(cache, image, lang=lang)
+            if high_confidence >= confidence:
+                text, confidence, dpi = high_text, high_confidence, HIGH_DPI
+        dpi_stats.add(dpi)
 
-        print(f"Processed {img_path} successfully")
+        directory = txt_dir(pdf_path)
+        write_page_info(
+            os.path.join(directory, f"{page_number}.json"),
+            {
+                "confidence": round(confidence, 1),
+                "arabic_ratio": round(arabic_ratio(text), 3),
+                "dpi": dpi,
+            },
+        )
+        # last, an existing {page}.txt means the page is done
+        write_text(os.path.join(directory, f"{page_number}.txt"), text)
+        print(f"Processed page {page_number} of {pdf_path} successfully ({dpi} DPI, confidence {confidence:.0f})")
     except Exception as e:
-        print(f"Error processing {img_path}: {e}")
-
-def image_to_text_parallel(base_dir, lang='ara', max_workers=None):
-    # Use ThreadPoolExecutor to parallelize OCR processing
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Iterate through each image file in the directory
-        for root, _, files in os.walk(base_dir):
-            for file in files:
-                if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    # Construct image file path
-                    img_path = os.path.join(root, file)
-                    
-                    # Submit OCR task to the executor
-                    executor.submit(process_image, img_path, lang=lang)
-
-image_to_text_parallel('joradp_pdfs', 'ara', max_workers=6)  # Adjust max_workers as needed
+        print(f"Error processing page {page_number} of {pdf_path}: {e}")
+    finally:
+        scheduler.pending_pages.release()
+
+
+def render_chunk(scheduler, cache, chunk, lang='ara'):
+    """Render stage: renders the pages of the chunk and hands them to the OCR
+    stage, returns the OCR futures"""
+    pdf_path, first_page, last_page = chunk
+    futures = []
+    for page_number in range(first_page, last_page + 1):
+        # Check if text path already exists (text layer or previous run)
+        if os.path.exists(os.path.join(txt_dir(pdf_path), f"{page_number}.txt")):
+            print(f"Text file already exists for page {page_number} of {pdf_path}")
+            continue
+
+        # waits while the OCR is behind
+        scheduler.pending_pages.acquire()
+        try:
+            image = render_page(pdf_path, page_number, dpi=LOW_DPI)
+        except Exception as e:
+            scheduler.pending_pages.release()
+            print(f"Error rendering page {page_number} of {pdf_path}: {e}")
+            continue
+        futures.append(
+            scheduler.ocr.submit(ocr_page, scheduler, cache, pdf_path, page_number, image, lang=lang)
+        )
+    return futures
+
+
+def plan_journal(pdf_path, page_range):
+    """Chunks of the pages of page_range without {page}.txt, the pages of
+    the pdf (pdfinfo) bound an open page_range"""
+    try:
+        return page_chunks(pdf_path, pages_in(missing_pages(pdf_path), page_range), CHUNK_PAGES)
+    except Exception as e:
+        print(f"Error reading {pdf_path}: {e}")
+        return []
+
+
+def pdf_to_text_parallel(base_dir, lang='ara', cores=None):
+    # rendering and OCR share the cores of the host, the work is done by the
+    # pdftoppm / tesseract processes
+    db_engine = create_engine(os.getenv("PG_URL"))
+    cache = OcrCache(db_engine)
+    # only the pages the laws of the journals are on, the others are OCRed
+    # once a law points to them
+    demand = required_pages(db_engine)
+    with CpuScheduler(cores) as scheduler:
+        # pages without {page}.txt of the journals having laws, by chunks of pages
+        pdf_files = [
+            pdf_path for pdf_path in journal_pdfs(base_dir) if journal_key(pdf_path) in demand
+        ]
+        plans = [
+            scheduler.render.submit(plan_journal, pdf_path, demand[journal_key(pdf_path)])
+            for pdf_path in pdf_files
+        ]
+        chunks = interleave(dict(zip(pdf_files, (plan.result() for plan in plans))))
+        progress = JournalProgress(chunks)
+        print(f"{len(chunks)} chunks to OCR: {scheduler.stats()}")
+
+        # Submit the chunks to the render stage, which feeds the OCR stage
+        render_futures = {
+            scheduler.render.submit(render_chunk, scheduler, cache, chunk, lang=lang): chunk
+            for chunk in chunks
+        }
+        for future in as_completed(render_futures):
+            pdf_path = render_futures[future][0]
+            wait(future.result())
+            if progress.add(pdf_path, None) is not None:
+                print(f"OCR of {pdf_path} done ({progress.done} / {progress.total} chunks)")
+            if progress.done % STATS_EVERY == 0:
+                print(f"OCR scheduler: {scheduler.stats()}, cache: {cache.stats()}, DPI: {dpi_stats.stats()}, preprocessing: {preprocess_stats.stats()}")
+        print(f"OCR scheduler: {scheduler.stats()}, cache: {cache.stats()}, DPI: {dpi_stats.stats()}, preprocessing: {preprocess_stats.stats()}")
+    close_engines()
+
+
+if __name__ == '__main__':
+    # sized from os.sched_getaffinity, pass cores=N to use less
+    pdf_to_text_parallel('joradp_pdfs', 'ara')
@@ -0,0 +1,121 @@
+import os
+from pdf2image import pdfinfo_from_path
+
+
+# Conversion and OCR are scheduled by page ranges of a journal rather than by
+# whole journal, so that a 300 pages annex doesn't keep one worker busy while
+# the others are idle
+
+CHUNK_PAGES = 8
+
+
+def journal_key(pdf_path):
+    """joradp_pdfs/2024/2024_12.pdf -> (2024, 12)"""
+    year, number = os.path.basename(pdf_path).rsplit(".", 1)[0].split("_")
+    return int(year), int(number)
+
+
+def journal_pdfs(base_dir, after=None):
+    """Journals of base_dir/{year}/{year}_{number}.pdf sorted by (year,
+    number), only the ones after the (year, number) `after` if given"""
+    pdf_files = []
+    for year_entry in os.scandir(base_dir):
+        if not (year_entry.is_dir() and year_entry.name.isdigit()):
+            continue
+        if after is not None and int(year_entry.name) < after[0]:
+            continue
+        for entry in os.scandir(year_entry.path):
+            if not entry.name.endswith(".pdf"):
+                continue
+            try:
+                key = journal_key(entry.path)
+            except ValueError:
+                continue
+            if after is None or key > after:
+                pdf_files.append(entry.path)
+    pdf_files.sort(key=journal_key)
+    return pdf_files
+
+
+def txt_dir(pdf_path):
+    # the {page}.txt files of a journal are next to it
+    return pdf_path.rsplit(".", 1)[0]
+
+
+def page_count(pdf_path):
+    return pdfinfo_from_path(pdf_path)["Pages"]
+
+
+def missing_pages(pdf_path, pages=None):
+    """Pages of the pdf that have no {page}.txt yet"""
+    directory = txt_dir(pdf_path)
+    pages = pages or page_count(pdf_path)
+    existing = set(os.listdir(directory)) if os.path.isdir(directory) else set()
+    return [
+        page_number
+        for page_number in range(1, pages + 1)
+        if f"{page_number}.txt" not in existing
+    ]
+
+
+def page_ranges(page_numbers):
+    """[1, 2, 3, 7, 9, 10] -> [(1, 3), (7, 7), (9, 10)]"""
+    ranges = []
+    for page_number in sorted(page_numbers):
+        if ranges and ranges[-1][1] == page_number - 1:
+            ranges[-1] = (ranges[-1][0], page_number)
+        else:
+            ranges.append((page_number, page_number))
+    return ranges
+
+
+def page_chunks(pdf_path, page_numbers, chunk_pages=CHUNK_PAGES):
+    """(pdf_path, first_page, last_page) work units of at most chunk_pages
+    pages covering page_numbers"""
+    chunks = []
+    for first_page, last_page in page_ranges(page_numbers):
+        for chunk_first in range(first_page, last_page + 1, chunk_pages):
+            chunks.append(
+                (pdf_path, chunk_first, min(last_page, chunk_first + chunk_pages - 1))
+            )
+    return chunks
+
+
+def interleave(chunks_by_journal):
+    """Round robin over the journals, the big journals' chunks first, so that
+    the last chunks to run are small and from different journals"""
+    queues = sorted(
+        (list(chunks) for chunks in chunks_by_journal.values() if chunks),
+        key=len,
+        reverse=True,
+    )
+    chunks = []
+    while queues:
+        for queue in queues:
+            chunks.append(queue.pop(0))
+        queues = [queue for queue in queues if queue]
+    return chunks
+
+
+class JournalProgress:
+    """Reassembles the results of the chunks per journal"""
+
+    def __init__(self, chunks):
+        self.remaining = {}
+        self.results = {}
+        for pdf_path, _, _ in chunks:
+            self.remaining[pdf_path] = self.remaining.get(pdf_path, 0) + 1
+            self.results.setdefault(pdf_path, [])
+        self.total = len(chunks)
+        self.done = 0
+
+    def add(self, pdf_path, result):
+        """Returns the results of the journal once all its chunks are done,
+        None before"""
+        self.done += 1
+        self.results[pdf_path].append(result)
+        self.remaining[pdf_path] -= 1
+        if self.remaining[pdf_path] == 0:
+            del self.remaining[pdf_path]
+            return self.results.pop(pdf_path)
+        return None
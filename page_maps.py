@@ -0,0 +1,88 @@
+from datetime import date as dt
+from sqlalchemy import Column, Integer, Date, select
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from bs4 import BeautifulSoup
+
+
+# Page maps of the pre-2000 journals (A_Pag1.htm): they never change once
+# published, so they are fetched once and kept in the db for fix_pages.py and
+# the stages that need the physical page of a printed page number
+
+Base = declarative_base()
+
+
+class JournalPageMap(Base):
+    __tablename__ = "journal_page_maps"
+    year = Column(Integer, primary_key=True, autoincrement=False)
+    number = Column(Integer, primary_key=True, autoincrement=False)
+    # printed page number of every physical page (1, 2, ...), None when the
+    # entry is not a number
+    printed_pages = Column(ARRAY(Integer))
+    fetched_on = Column(Date)
+
+
+def parse_printed_pages(body):
+    """Printed page numbers listed by A_Pag1.htm, in physical page order"""
+    soup = BeautifulSoup(body, "html.parser")
+    texts = [row.text.strip() for row in soup.find_all("tr")][1:]
+    return [int(text) if text.isdigit() else None for text in texts]
+
+
+def usable_map(printed_pages):
+    """False for an empty or garbled A_Pag1.htm, not a single page number"""
+    return any(printed_page is not None for printed_page in printed_pages)
+
+
+def needs_remap(printed_pages):
+    # the printed numbers start at 1 when they are the physical pages
+    return bool(printed_pages) and printed_pages[0] != 1
+
+
+def page_map(printed_pages):
+    """printed page -> physical page, the first occurrence of a printed page
+    wins"""
+    mapping = {}
+    for physical_page, printed_page in enumerate(printed_pages, start=1):
+        if printed_page is not None:
+            mapping.setdefault(printed_page, physical_page)
+    return mapping
+
+
+def load_page_map(connection, year, number):
+    """printed page -> physical page of the journal, None if not stored"""
+    row = connection.execute(
+        select(JournalPageMap.printed_pages).where(
+            JournalPageMap.year == int(year),
+            JournalPageMap.number == int(number),
+        )
+    ).first()
+    return page_map(row.printed_pages) if row is not None else None
+
+
+def load_page_maps(connection, year):
+    """{journal number: printed pages} of the maps stored for the year"""
+    rows = connection.execute(
+        select(JournalPageMap.number, JournalPageMap.printed_pages).where(
+            JournalPageMap.year == int(year)
+        )
+    ).all()
+    return {row.number: row.printed_pages for row in rows}
+
+
+def store_page_map(connection, year, number, printed_pages):
+    statement = insert(JournalPageMap).values(
+        year=int(year),
+        number=int(number),
+        printed_pages=printed_pages,
+        fetched_on=dt.today(),
+    )
+    excluded = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=[JournalPageMap.year, JournalPageMap.number],
+        set_={
+            "printed_pages": excluded.printed_pages,
+            "fetched_on": excluded.fetched_on,
+        },
+    )
+    connection.execute(statement)
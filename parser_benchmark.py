@@ -0,0 +1,141 @@
+import gc
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import tracemalloc
+from joradp_parser import parse_results_page, parse_law_ids
+
+
+# Saved joradp.dz results pages + expected.json (counts and digest of the
+# records of every page, rewritten with --update)
+CORPUS_DIR = "parser_corpus"
+EXPECTED_PATH = os.path.join(CORPUS_DIR, "expected.json")
+REPEAT = 20
+# a page taking longer than this fails the benchmark, a 200 laws page takes
+# ~20 ms with lxml and was ~250 ms with BeautifulSoup
+MS_PER_PAGE_BUDGET = 50
+
+# the parser logs every row, the benchmark measures the parsing only
+logging.getLogger("joradp_parser").disabled = True
+
+
+def records_digest(laws, associations):
+    digest = hashlib.sha256()
+    for record in laws + associations:
+        digest.update(repr(record).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_corpus():
+    with open(EXPECTED_PATH, "r", encoding="utf-8") as f:
+        expected = json.load(f)
+    corpus = []
+    for name in sorted(expected):
+        with open(os.path.join(CORPUS_DIR, name), "r", encoding="utf-8") as f:
+            corpus.append((name, f.read(), expected[name]))
+    return corpus
+
+
+def check(corpus):
+    """The records of every page must not change while optimising"""
+    ok = True
+    for name, html, expected in corpus:
+        laws, associations = parse_results_page(html, expected["law_type"])
+        found = {
+            "laws": len(laws),
+            "associations": len(associations),
+            "digest": records_digest(laws, associations),
+        }
+        for key, value in found.items():
+            if expected.get(key) != value:
+                print(f"{name}: {key} is {value}, expected {expected.get(key)}")
+                ok = False
+    return ok
+
+
+def update(corpus):
+    expected = {}
+    for name, html, page_expected in corpus:
+        laws, associations = parse_results_page(html, page_expected["law_type"])
+        expected[name] = {
+            "law_type": page_expected["law_type"],
+            "laws": len(laws),
+            "associations": len(associations),
+            "digest": records_digest(laws, associations),
+        }
+    with open(EXPECTED_PATH, "w", encoding="utf-8") as f:
+        json.dump(expected, f, ensure_ascii=False, indent=2)
+
+
+def benchmark(corpus, repeat=REPEAT, budget=MS_PER_PAGE_BUDGET):
+    """Prints the speed and memory of the parser, False if a page is over
+    the budget (ms per page)"""
+    ok = True
+    total_rows = 0
+    total_time = 0.0
+    print(f"{'page':<32}{'rows':>6}{'rows/s':>10}{'ms/page':>10}{'live blks':>10}{'peak KiB':>10}")
+    for name, html, expected in corpus:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            laws, associations = parse_results_page(html, expected["law_type"])
+        elapsed = time.perf_counter() - start
+
+        # memory of one parse, measured apart (tracemalloc slows it down):
+        # peak while parsing, and blocks still held with the records alive
+        del laws, associations
+        gc.collect()
+        tracemalloc.start()
+        snapshot_before = tracemalloc.take_snapshot()
+        laws, associations = parse_results_page(html, expected["law_type"])
+        gc.collect()
+        snapshot_after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        live_blocks = sum(
+            stat.count_diff
+            for stat in snapshot_after.compare_to(snapshot_before, "filename")
+            if stat.count_diff > 0
+        )
+
+        ms_per_page = elapsed / repeat * 1000
+        rows = len(laws) * repeat
+        total_rows += rows
+        total_time += elapsed
+        rows_per_second = rows / elapsed if elapsed else 0
+        print(
+            f"{name:<32}{len(laws):>6}{rows_per_second:>10.0f}"
+            f"{ms_per_page:>10.1f}{live_blocks:>10}{peak / 1024:>10.0f}"
+        )
+        if ms_per_page > budget:
+            print(f"{name}: {ms_per_page:.1f} ms per page, over the {budget} ms budget")
+            ok = False
+
+    if not total_time:
+        print("empty corpus, nothing measured")
+        return ok
+    print(f"total: {total_rows / total_time:.0f} rows/s over {repeat} runs")
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _, html, _ in corpus:
+            parse_law_ids(html)
+    elapsed = time.perf_counter() - start
+    print(f"parse_law_ids: {total_rows / elapsed if elapsed else 0:.0f} rows/s")
+    return ok
+
+
+if __name__ == "__main__":
+    # python parser_benchmark.py [repeat] [--update]
+    corpus = load_corpus()
+    if "--update" in sys.argv:
+        update(corpus)
+        print(f"{EXPECTED_PATH} updated")
+        sys.exit(0)
+    if not check(corpus):
+        sys.exit(1)
+    repeat = next((int(arg) for arg in sys.argv[1:] if arg.isdigit()), REPEAT)
+    if not benchmark(corpus, repeat):
+        sys.exit(1)
@@ -0,0 +1,338 @@
+import ast
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from joradp_throttle import get_limiter
+
+
+BASE_URL = "https://www.joradp.dz/FTP/JO-ARABE/"
+PDFS_DIR = "joradp_pdfs"
+MANIFEST_PATH = f"{PDFS_DIR}/manifest.json"
+
+# Total number of downloads running at the same time (all years / numbers)
+MAX_WORKERS = 8
+# Never open more than this many connections to the same host
+MAX_PER_HOST = 4
+# Size of the chunks read from the socket and of the file write buffer
+CHUNK_SIZE = 256 * 1024
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+TIMEOUT = (10, 120)
+
+
+def build_pdf_url(year, number, max_number):
+    # The journals of the years having more than 99 numbers are named
+    # A{year}{number} with a 3 digits number, except for 2021
+    if int(max_number) > 99:
+        if int(year) == 2021:
+            return f"{BASE_URL}{year}/A{year}0{number}.pdf"
+        return f"{BASE_URL}{year}/A{year}{number}.pdf"
+    return f"{BASE_URL}{year}/A{year}0{number}.pdf"
+
+
+def build_jobs(data, base_dir=PDFS_DIR):
+    """Turns {year: [numbers]} into the list of pdfs to download"""
+    jobs = []
+    for year, numbers in data.items():
+        if not numbers:
+            continue
+        # the first option of the year is its last (biggest) number
+        max_number = numbers[0]
+        for number in numbers:
+            jobs.append(
+                {
+                    "year": year,
+                    "number": number,
+                    "url": build_pdf_url(year, number, max_number),
+                    "path": f"{base_dir}/{year}/{year}_{int(number)}.pdf",
+                }
+            )
+    return jobs
+
+
+def manifest_key(job):
+    return f"{job['year']}_{int(job['number'])}"
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        # a corrupted manifest only costs a full re-download
+        return {}
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256
+
+
+def is_complete(entry, path):
+    return (
+        entry is not None
+        and entry.get("sha256")
+        and os.path.exists(path)
+        and os.path.getsize(path) == entry.get("size")
+    )
+
+
+def without_partial(entry):
+    """The manifest entry without its interrupted transfer"""
+    return {k: v for k, v in (entry or {}).items() if k != "partial"}
+
+
+def request_headers(entry, path):
+    """Conditional / range headers for a journal given its manifest entry"""
+    headers = {}
+    part_path = f"{path}.part"
+    partial = (entry or {}).get("partial")
+    if partial and os.path.exists(part_path) and os.path.getsize(part_path) > 0:
+        # resume the interrupted transfer, only if the file did not change since
+        validator = partial.get("etag") or partial.get("last_modified")
+        if validator:
+            headers["Range"] = f"bytes={os.path.getsize(part_path)}-"
+            headers["If-Range"] = validator
+            return headers
+    if is_complete(entry, path):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def write_pdf(job, entry, partial_content, chunks):
+    """Writes the downloaded chunks to the journal's .part file and moves it
+    in place if its content changed, returns (sha256, bytes written, changed)"""
+    part_path = f"{job['path']}.part"
+    os.makedirs(os.path.dirname(job["path"]), exist_ok=True)
+    if partial_content:
+        # the server accepted the range: hash what we already have
+        # and append the rest
+        sha256 = file_sha256(part_path)
+        mode = "ab"
+    else:
+        sha256 = hashlib.sha256()
+        mode = "wb"
+
+    # write to a temporary file so an interrupted download
+    # never leaves a truncated pdf behind
+    written = 0
+    with open(part_path, mode, buffering=WRITE_BUFFER_SIZE) as f:
+        for chunk in chunks:
+            f.write(chunk)
+            sha256.update(chunk)
+            written += len(chunk)
+
+    digest = sha256.hexdigest()
+    if is_complete(entry, job["path"]) and entry["sha256"] == digest:
+        # same content served again (no validators on the server side)
+        os.remove(part_path)
+        return digest, written, False
+    os.replace(part_path, job["path"])
+    return digest, written, True
+
+
+def manifest_entry(job, etag, last_modified, digest):
+    return {
+        "url": job["url"],
+        "size": os.path.getsize(job["path"]),
+        "etag": etag,
+        "last_modified": last_modified,
+        "sha256": digest,
+    }
+
+
+class PdfDownloader:
+    def __init__(
+        self,
+        max_workers=MAX_WORKERS,
+        max_per_host=MAX_PER_HOST,
+        logger=None,
+        manifest_path=MANIFEST_PATH,
+    ):
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.logger = logger or logging.getLogger(__name__)
+        self.manifest_path = manifest_path
+        self.manifest = load_manifest(manifest_path)
+        self._sessions = {}
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        return urlsplit(url).netloc
+
+    def _session_for(self, host):
+        # One keep-alive connection pool per host, shared by all the workers
+        with self._lock:
+            if host not in self._sessions:
+                session = requests.Session()
+                retries = Retry(
+                    total=3,
+                    backoff_factor=1,
+                    status_forcelist=[500, 502, 503, 504],
+                    allowed_methods=["GET", "HEAD"],
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.max_per_host,
+                    max_retries=retries,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.verify = False
+                self._sessions[host] = session
+                self._host_slots[host] = threading.BoundedSemaphore(
+                    self.max_per_host
+                )
+            return self._sessions[host], self._host_slots[host]
+
+    def _update_manifest(self, key, entry):
+        with self._lock:
+            self.manifest[key] = entry
+
+    def _fetch(self, session, job, result):
+        key = manifest_key(job)
+        entry = self.manifest.get(key)
+        part_path = f"{job['path']}.part"
+        headers = request_headers(entry, job["path"])
+
+        with session.get(
+            job["url"], stream=True, timeout=TIMEOUT, headers=headers
+        ) as response:
+            result["status"] = response.status_code
+            result["ttfb"] = response.elapsed.total_seconds()
+            if response.status_code == 304:
+                result["ok"] = True
+                return
+            if response.status_code == 416:
+                # the partial file no longer fits the journal on the server
+                os.remove(part_path)
+                self._update_manifest(key, without_partial(entry))
+                return
+            if response.status_code not in (200, 206):
+                return
+
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+
+            new_entry = dict(entry or {})
+            new_entry["partial"] = {"etag": etag, "last_modified": last_modified}
+            self._update_manifest(key, new_entry)
+
+            digest, result["bytes"], result["changed"] = write_pdf(
+                job,
+                entry,
+                response.status_code == 206,
+                response.iter_content(chunk_size=CHUNK_SIZE),
+            )
+
+        self._update_manifest(key, manifest_entry(job, etag, last_modified, digest))
+        result["ok"] = True
+
+    def download(self, job):
+        result = dict(
+            job, status=None, ok=False, changed=False, bytes=0, elapsed=0.0, error=None
+        )
+        session, slots = self._session_for(self._host(job["url"]))
+        start = time.perf_counter()
+        try:
+            with slots, get_limiter().request() as outcome:
+                self._fetch(session, job, result)
+                if result["status"] == 416:
+                    # once more without Range / If-Range, the whole journal
+                    self._fetch(session, job, result)
+                # time to first byte, the transfer time depends on the size
+                outcome["latency"] = result.pop("ttfb", 0.0)
+                outcome["ok"] = result["status"] is not None and result["status"] < 500
+        except Exception as e:
+            result["ok"] = False
+            result["error"] = str(e)
+        result["elapsed"] = time.perf_counter() - start
+
+        if result["ok"] and not result["changed"]:
+            self.logger.info(
+                f"Unchanged: {job['year']}_{job['number']}.pdf ({result['elapsed']:.2f}s)"
+            )
+        elif result["ok"]:
+            self.logger.info(
+                f"Downloaded: {job['year']}_{job['number']}.pdf "
+                f"({result['bytes'] / 1024:.0f} KB in {result['elapsed']:.2f}s)"
+            )
+        elif result["error"] is not None:
+            self.logger.info(
+                f"Failed to download {job['year']}_{job['number']}.pdf: {result['error']}"
+            )
+        else:
+            self.logger.info(
+                f"Failed to download {job['year']}_{job['number']}.pdf. Status Code: {result['status']}"
+            )
+        return result
+
+    def download_all(self, jobs):
+        """Downloads the jobs concurrently and yields the results in the
+        calling thread as they complete"""
+        total_bytes = 0
+        downloaded = 0
+        unchanged = 0
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(self.download, job) for job in jobs]
+                for future in as_completed(futures):
+                    result = future.result()
+                    total_bytes += result["bytes"]
+                    if result["ok"] and result["changed"]:
+                        downloaded += 1
+                    elif result["ok"]:
+                        unchanged += 1
+                    yield result
+        finally:
+            save_manifest(self.manifest, self.manifest_path)
+            get_limiter().save()
+
+        elapsed = time.perf_counter() - start
+        throughput = total_bytes / elapsed / (1024 * 1024) if elapsed else 0
+        self.logger.info(
+            f"Downloaded {downloaded}/{len(jobs)} pdfs ({unchanged} unchanged), "
+            f"{total_bytes / (1024 * 1024):.1f} MB in {elapsed:.1f}s ({throughput:.2f} MB/s), "
+            f"throttle: {get_limiter().stats()}"
+        )
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+
+
+if __name__ == "__main__":
+    # Re-download the journals listed by the last newspapers_scraper run
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    with open("pdf_numbers.txt", "r") as f:
+        data = ast.literal_eval(f.readline())
+
+    downloader = PdfDownloader()
+    for result in downloader.download_all(build_jobs(data)):
+        pass
+    downloader.close()
@@ -1,13 +1,22 @@
-from multiprocessing import Pool, Value, Lock, current_process
+from multiprocessing import Pool
 import os
 import logging
-from pdf2image import convert_from_path
-from datetime import date as dt
 from sqlalchemy import create_engine, Column, Integer, Date
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.dialects.postgresql import ARRAY
 from dotenv import load_dotenv
+from text_layer import extract_text_layer
+from cpu_scheduler import available_cores
+from page_chunks import (
+    JournalProgress,
+    interleave,
+    journal_key,
+    journal_pdfs,
+    missing_pages,
+    page_chunks,
+    page_count,
+    txt_dir,
+)
 
 
 load_dotenv()
@@ -39,38 +48,30 @@ class LastScrapingDate(Base):
     fix_law_texts = Column(Date)
     
 
-# Define the shared counter and lock globally so that they are inherited
-total_files = None  # This will be set later
-count = Value('i', 0)  # Shared counter
-lock = Lock()  # Mutex for accessing the shared counter
+# pdftotext reads a page in a few ms, the chunks can be bigger than the OCR's
+CHUNK_PAGES = 16
+
 
-def convert_pdf_to_images(pdf_path):
+def journal_pages(pdf_path):
     try:
-        logging.info(f"Starting conversion of {pdf_path}")
-        # Create a directory for the images, stripping .pdf and replacing with nothing
-        imgs_dir = pdf_path.rsplit(".", 1)[0]
-        if not os.path.exists(imgs_dir):
-            os.makedirs(imgs_dir)
-            logging.info(f"Created directory {imgs_dir}")
-
-        # Convert PDF to images
-        convert_from_path(
-            pdf_path=pdf_path,
-            output_folder=imgs_dir,
-            fmt='jpeg',
-            output_file="journal",
-            # Adjust the number of threads as necessary
-            thread_count=2,
-            paths_only=True,
-        )
-        logging.info(f"Saved images of {pdf_path} to {imgs_dir}")
-
-        with lock:
-            count.value += 1
-            percentage_complete = (count.value / total_files) * 100
-            print(f"Conversion progress: {percentage_complete:.2f}% ({count.value} / {total_files} files) completed by {current_process().name}.")
+        return pdf_path, page_count(pdf_path)
     except Exception as e:
-        logging.error(f"Error converting {pdf_path}: {e}")
+        logging.error(f"Error reading {pdf_path}: {e}")
+        return pdf_path, 0
+
+
+def convert_chunk(chunk):
+    pdf_path, first_page, last_page = chunk
+    try:
+        # pages with a usable text layer are written as {page}.txt right
+        # away, ocr_images.py renders and OCRs the others in memory, no
+        # image is written to disk anymore
+        ocr_pages = extract_text_layer(pdf_path, txt_dir(pdf_path), first_page, last_page)
+    except Exception as e:
+        logging.error(f"Error converting pages {first_page}-{last_page} of {pdf_path}: {e}")
+        ocr_pages = None
+    return chunk, ocr_pages
+
 
 def convert_pdfs_to_images(base_dir):
     Base.metadata.create_all(engine)
@@ -80,31 +81,38 @@ def convert_pdfs_to_images(base_dir):
     year = session.query(LastScrapingDate).first().pdfs_to_images_conversion_journal_year
     journal_number = session.query(LastScrapingDate).first().pdfs_to_images_conversion_journal_number
     print(f"last scraping year: {year}, last scraping journal_number: {journal_number}")
-    global total_files
-    # Walk the directory to list all PDF files
-    # Construct PDF file path and append it to the list
-    pdf_files = [
-        os.path.join(root, file)
-        for root, _, files in os.walk(base_dir)
-        for file in files 
-        if (file.endswith(".pdf") and (int(file.split("_")[0]) > year or (int(file.split("_")[0]) == year and int(file.split("_")[1].split(".")[0]) > journal_number)))
-    ]
-        
-    # Sort the list based on year and journal number
-    pdf_files.sort(key=lambda x: (int(os.path.basename(x).split("_")[0]), int(os.path.basename(x).split("_")[1].split(".")[0])))
-    
+    # journals after the last converted one, sorted by year and number
+    after = (year, journal_number) if year is not None else None
+    pdf_files = journal_pdfs(base_dir, after=after)
     print(f"pdf_files: {pdf_files}")
-    total_files = len(pdf_files)  # Set the total number of files to be processed
 
-    # Adjust the number of processes as necessary
-    with Pool(processes=8) as pool:
-        pool.map(convert_pdf_to_images, pdf_files)
+    # one pdftotext per core this process may run on
+    with Pool(processes=available_cores()) as pool:
+        chunks_by_journal = {}
+        for pdf_path, pages in pool.map(journal_pages, pdf_files):
+            if pages:
+                chunks_by_journal[pdf_path] = page_chunks(
+                    pdf_path, missing_pages(pdf_path, pages), CHUNK_PAGES
+                )
+        chunks = interleave(chunks_by_journal)
+        progress = JournalProgress(chunks)
+
+        for chunk, ocr_pages in pool.imap_unordered(convert_chunk, chunks):
+            pdf_path = chunk[0]
+            journal_results = progress.add(pdf_path, ocr_pages)
+            percentage_complete = (progress.done / progress.total) * 100
+            print(f"Conversion progress: {percentage_complete:.2f}% ({progress.done} / {progress.total} chunks) completed.")
+            if journal_results is not None:
+                left = sum(len(result) for result in journal_results if result is not None)
+                failed = sum(1 for result in journal_results if result is None)
+                logging.info(f"{pdf_path} done: {left} pages left for the OCR, {failed} chunks without text layer")
     
     last_scraping_date = session.query(LastScrapingDate).first()
     if pdf_files:
         last_pdf_file = pdf_files[-1]  # Get the last PDF file after sorting
-        last_scraping_date.pdfs_to_images_conversion_journal_year = int(os.path.basename(last_pdf_file).split("_")[0])
-        last_scraping_date.pdfs_to_images_conversion_journal_number = int(os.path.basename(last_pdf_file).split("_")[1].split(".")[0])
+        last_year, last_number = journal_key(last_pdf_file)
+        last_scraping_date.pdfs_to_images_conversion_journal_year = last_year
+        last_scraping_date.pdfs_to_images_conversion_journal_number = last_number
     session.commit()
 
 if __name__ == '__main__':
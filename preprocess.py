@@ -0,0 +1,219 @@
+import sys
+import time
+import threading
+import numpy as np
+from PIL import Image
+
+
+# Clean up of a rendered page before the OCR, on the pixels in memory:
+# binarized, straightened, without the rule under the running header of the
+# journal and cropped to the text. Tesseract has fewer pixels to go through
+# and doesn't read the rule as a line of dashes. Only the rule is removed,
+# never the rows of text around it.
+
+# ink pixels a row / column needs to not be margin (share of its length),
+# ignores the scanner specks
+MIN_INK_SHARE = 0.002
+# white kept around the text
+PADDING = 10
+# the rule under the running header is searched in the top of the page
+HEADER_SEARCH_SHARE = 0.15
+# rows this much inked are a rule
+RULE_INK_SHARE = 0.5
+# a rule is at most this many rows high (a thin line, not a frame or a bold
+# title) with at least BLANK_ROWS blank rows on both sides (not a table
+# border touching its cells)
+MAX_RULE_ROWS = 6
+BLANK_ROWS = 3
+# skew angles tried, in degrees
+MAX_SKEW = 3.0
+SKEW_STEP = 0.25
+# the skew is measured on every SKEW_SAMPLE-th ink pixel
+SKEW_SAMPLE = 8
+
+
+def otsu_threshold(pixels):
+    """Lightest gray level of the ink, the paper is above it (Otsu's
+    method)"""
+    histogram = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight_dark = np.cumsum(histogram)
+    weight_light = weight_dark[-1] - weight_dark
+    sum_dark = np.cumsum(histogram * levels)
+    mean_dark = sum_dark / np.maximum(weight_dark, 1)
+    mean_light = (sum_dark[-1] - sum_dark) / np.maximum(weight_light, 1)
+    between = weight_dark * weight_light * (mean_dark - mean_light) ** 2
+    return int(np.argmax(between))
+
+
+def skew_angle(ink):
+    """Angle (degrees) that makes the lines of the page horizontal: the one
+    giving the sharpest profile of ink per row"""
+    rows, columns = np.nonzero(ink)
+    if len(rows) == 0:
+        return 0.0
+    rows = rows[::SKEW_SAMPLE].astype(np.float64)
+    columns = columns[::SKEW_SAMPLE].astype(np.float64)
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-MAX_SKEW, MAX_SKEW + SKEW_STEP / 2, SKEW_STEP):
+        sheared = np.round(rows + columns * np.tan(np.radians(angle))).astype(np.int64)
+        profile = np.bincount(sheared - sheared.min())
+        score = float(np.sum(np.diff(profile) ** 2))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def header_rules(ink):
+    """(first row, last row + 1) of the thin isolated rules in the top of the
+    page"""
+    height, width = ink.shape
+    counts = ink[: int(height * HEADER_SEARCH_SHARE) + BLANK_ROWS].sum(axis=1)
+    ruled = counts > width * RULE_INK_SHARE
+    blank = counts <= width * MIN_INK_SHARE
+    search_rows = int(height * HEADER_SEARCH_SHARE)
+    rules = []
+    row = 0
+    while row < search_rows:
+        if not ruled[row]:
+            row += 1
+            continue
+        end = row
+        while end < len(ruled) and ruled[end]:
+            end += 1
+        if (
+            end - row <= MAX_RULE_ROWS
+            and row >= BLANK_ROWS
+            and blank[row - BLANK_ROWS:row].all()
+            and end + BLANK_ROWS <= len(blank)
+            and blank[end:end + BLANK_ROWS].all()
+        ):
+            rules.append((row, end))
+        row = end
+    return rules
+
+
+def text_bounds(ink):
+    """(top, bottom, left, right) of the inked part of the page, None if
+    blank"""
+    height, width = ink.shape
+    rows = np.nonzero(ink.sum(axis=1) > width * MIN_INK_SHARE)[0]
+    columns = np.nonzero(ink.sum(axis=0) > height * MIN_INK_SHARE)[0]
+    if len(rows) == 0 or len(columns) == 0:
+        return None
+    return (
+        max(0, rows[0] - PADDING),
+        min(height, rows[-1] + 1 + PADDING),
+        max(0, columns[0] - PADDING),
+        min(width, columns[-1] + 1 + PADDING),
+    )
+
+
+def preprocess(image):
+    """(cleaned grayscale image, {pixels_before, pixels_after, skew,
+    seconds}) of a grayscale page"""
+    start = time.perf_counter()
+    pixels = np.asarray(image.convert("L"))
+    pixels_before = pixels.size
+
+    ink = pixels <= otsu_threshold(pixels)
+    angle = skew_angle(ink)
+    if angle:
+        # rotated as black on white, the corners brought in are paper
+        rotated = Image.fromarray(np.where(ink, 0, 255).astype(np.uint8)).rotate(
+            -angle, resample=Image.NEAREST, fillcolor=255
+        )
+        ink = np.asarray(rotated) < 128
+
+    for first_row, end_row in header_rules(ink):
+        ink[first_row:end_row] = False
+    bounds = text_bounds(ink)
+    if bounds is not None:
+        top, bottom, left, right = bounds
+        ink = ink[top:bottom, left:right]
+
+    cleaned = Image.fromarray(np.where(ink, 0, 255).astype(np.uint8))
+    return cleaned, {
+        "pixels_before": pixels_before,
+        "pixels_after": ink.size,
+        "skew": angle,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+class PreprocessStats:
+    """Pixels removed and time spent by the preprocessing"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pages = 0
+        self.pixels_before = 0
+        self.pixels_after = 0
+        self.seconds = 0.0
+
+    def add(self, info):
+        with self._lock:
+            self.pages += 1
+            self.pixels_before += info["pixels_before"]
+            self.pixels_after += info["pixels_after"]
+            self.seconds += info["seconds"]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pages": self.pages,
+                "pixel_reduction": round(1 - self.pixels_after / self.pixels_before, 3) if self.pixels_before else 0.0,
+                "ms_per_page": round(1000 * self.seconds / self.pages, 1) if self.pages else 0.0,
+            }
+
+
+def line_heights(image):
+    """Heights of the runs of inked rows of the image, top to bottom"""
+    rows = (np.asarray(image) < 128).any(axis=1).astype(np.int8)
+    edges = np.diff(np.concatenate(([0], rows, [0])))
+    return np.nonzero(edges == -1)[0] - np.nonzero(edges == 1)[0]
+
+
+def check():
+    """Synthetic pages: the rule under a running header goes, the header text
+    above it stays, and so does a table border touching its cells"""
+    ok = True
+    body_rows = range(250, 1400, 40)
+
+    def header_page(pixels):
+        pixels[100:112, 200:1000] = 0  # header text
+        pixels[150:153, 100:1100] = 0  # rule under it
+
+    def table_page(pixels):
+        pixels[60:72, 200:1000] = 0  # title
+        pixels[100:112, 200:1000] = 0
+        pixels[140:143, 100:1100] = 0  # top border of a table
+        pixels[145:157, 200:1000] = 0  # cell text right under it
+
+    # (page, text lines, rules) expected after the preprocessing
+    for name, draw, lines, rules in (
+        ("header", header_page, 1 + len(body_rows), 0),
+        ("table", table_page, 3 + len(body_rows), 1),
+    ):
+        pixels = np.full((1600, 1200), 255, dtype=np.uint8)
+        draw(pixels)
+        for row in body_rows:
+            pixels[row:row + 12, 200:1000] = 0
+        cleaned, _ = preprocess(Image.fromarray(pixels))
+        heights = line_heights(cleaned)
+        found_lines = int(np.sum(heights > MAX_RULE_ROWS))
+        found_rules = int(np.sum(heights <= MAX_RULE_ROWS))
+        if (found_lines, found_rules) != (lines, rules):
+            print(
+                f"{name} page: {found_lines} text lines and {found_rules} rules left, "
+                f"expected {lines} and {rules}"
+            )
+            ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    # python3 preprocess.py: checks the header removal on synthetic pages
+    if not check():
+        sys.exit(1)
+    print("preprocess checks passed")
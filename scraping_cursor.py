@@ -0,0 +1,101 @@
+from datetime import date as dt
+from sqlalchemy import Column, Integer, String, Date
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+
+# Last results page stored for a (scraper, type, date window) so that a retry
+# of the same search skips the pages that are already in the db, shared by
+# laws_metadata_scraper.py and 9ita3.py. A page index only means something
+# for the search it comes from: a page that fails to be stored is scraped
+# again in the same run (PageNotStored), the next run has another start date.
+
+# end_date of the searches without an end bound
+OPEN_END = dt.fromisoformat("9999-12-31")
+# tries of the pages of a search when one of them fails to be stored
+MAX_STORE_TRIES = 3
+
+Base = declarative_base()
+
+
+class ScrapingCursor(Base):
+    __tablename__ = "scraping_cursors"
+    scraper = Column(String, primary_key=True)
+    law_type = Column(String, primary_key=True)
+    start_date = Column(Date, primary_key=True)
+    # OPEN_END when the search has no end bound
+    end_date = Column(Date, primary_key=True)
+    last_page = Column(Integer, default=-1)
+
+
+class PageNotStored(Exception):
+    """The laws of a results page could not be written, the page has to be
+    scraped again"""
+
+
+def unit_name(law_type, start_date, end_date=None):
+    """Name of a work unit in the logs: the law type, followed by the journal
+    date window when the type was split"""
+    if end_date is None:
+        return law_type
+    return f"{law_type}/{start_date.isoformat()}_{end_date.isoformat()}"
+
+
+class ScrapingCursors:
+    """Cursors of one scraper (laws_metadata, kita3)"""
+
+    def __init__(self, db_engine, scraper, logger):
+        self.Session = sessionmaker(bind=db_engine)
+        self.scraper = scraper
+        self.logger = logger
+
+    def _key(self, law_type, start_date, end_date):
+        return {
+            "scraper": self.scraper,
+            "law_type": law_type,
+            "start_date": start_date,
+            "end_date": end_date or OPEN_END,
+        }
+
+    def load(self, law_type, start_date, end_date=None):
+        """Last page stored, -1 if none"""
+        session = self.Session()
+        try:
+            cursor = session.get(ScrapingCursor, self._key(law_type, start_date, end_date))
+            return cursor.last_page if cursor else -1
+        finally:
+            session.close()
+
+    def save(self, law_type, start_date, page, end_date=None):
+        session = self.Session()
+        try:
+            session.merge(
+                ScrapingCursor(**self._key(law_type, start_date, end_date), last_page=page)
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            self.logger.error(f"Error saving the cursor of {law_type}: {e}")
+        finally:
+            session.close()
+
+    def clear(self, law_type, start_date, end_date=None):
+        key = self._key(law_type, start_date, end_date)
+        session = self.Session()
+        try:
+            session.query(ScrapingCursor).filter_by(**key).delete()
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            self.logger.error(f"Error clearing the cursor of {law_type}: {e}")
+        finally:
+            session.close()
+
+    def keep_or_clear(self, law_type, start_date, last_page, number_of_pages, end_date=None):
+        """Clears the cursor once every page is stored, logs the pages given
+        up on otherwise"""
+        if last_page == number_of_pages:
+            self.clear(law_type, start_date, end_date)
+            return
+        log_line = f"Pages {last_page + 1} to {number_of_pages} of {unit_name(law_type, start_date, end_date)} not stored after {MAX_STORE_TRIES} tries"
+        print(log_line)
+        self.logger.error(log_line)
@@ -0,0 +1,94 @@
+import os
+import re
+import subprocess
+import unicodedata
+import logging
+
+
+# Recent journals are born digital: their text layer is read directly with
+# poppler's pdftotext and only the pages without usable arabic text are
+# rasterized and OCRed
+
+PDFTOTEXT_TIMEOUT = 300
+# below this many arabic letters a page is considered scanned / empty
+MIN_ARABIC_LETTERS = 100
+MIN_ARABIC_RATIO = 0.6
+# broken font encodings come out as replacement / private use characters
+MAX_BAD_RATIO = 0.02
+# a text layer in visual order has these words reversed
+COMMON_WORDS = ("في", "من", "على", "المؤرخ", "المادة", "رقم")
+
+ARABIC_LETTER = re.compile(r"[\u0621-\u064a]")
+LETTER = re.compile(r"[^\W\d_]")
+BAD_CHARACTER = re.compile(r"[\ufffd\ue000-\uf8ff]")
+
+logger = logging.getLogger(__name__)
+
+
+def page_texts(pdf_path, first_page=1, last_page=None):
+    """Text layer of every page of the pdf in reading order (no -layout, the
+    columns would be merged line by line), pdftotext separates the pages with
+    form feeds"""
+    command = ["pdftotext", "-enc", "UTF-8", "-f", str(first_page)]
+    if last_page is not None:
+        command += ["-l", str(last_page)]
+    result = subprocess.run(
+        command + [pdf_path, "-"],
+        capture_output=True,
+        timeout=PDFTOTEXT_TIMEOUT,
+        check=True,
+    )
+    pages = result.stdout.decode("utf-8", errors="replace").split("\f")
+    # the last page is followed by a form feed too
+    if pages and not pages[-1].strip():
+        pages.pop()
+    # presentation forms (ﻻ, ﺍ, ...) -> the letters the OCR would give
+    return [unicodedata.normalize("NFKC", page) for page in pages]
+
+
+def arabic_ratio(text):
+    """Share of the letters of the text that are arabic, 0 without letters"""
+    letters = len(LETTER.findall(text))
+    return len(ARABIC_LETTER.findall(text)) / letters if letters else 0.0
+
+
+def usable_arabic(text):
+    arabic_letters = len(ARABIC_LETTER.findall(text))
+    if arabic_letters < MIN_ARABIC_LETTERS:
+        return False
+    if arabic_ratio(text) < MIN_ARABIC_RATIO:
+        return False
+    if len(BAD_CHARACTER.findall(text)) / len(text) > MAX_BAD_RATIO:
+        return False
+    words = text.split()
+    found = sum(words.count(word) for word in COMMON_WORDS)
+    reversed_found = sum(words.count(word[::-1]) for word in COMMON_WORDS)
+    return found > reversed_found
+
+
+def extract_text_layer(pdf_path, txt_dir, first_page=1, last_page=None):
+    """Writes {page}.txt for the pages (first_page to last_page) with a
+    usable text layer, returns the numbers of the pages that still need OCR,
+    None if pdftotext could not read the pdf"""
+    try:
+        pages = page_texts(pdf_path, first_page, last_page)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.error(f"Could not read the text layer of {pdf_path}: {e}")
+        return None
+
+    os.makedirs(txt_dir, exist_ok=True)
+    ocr_pages = []
+    for page_number, text in enumerate(pages, start=first_page):
+        txt_file_path = os.path.join(txt_dir, f"{page_number}.txt")
+        if os.path.exists(txt_file_path):
+            continue
+        if not usable_arabic(text):
+            ocr_pages.append(page_number)
+            continue
+        with open(txt_file_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    logger.info(
+        f"{pdf_path} pages {first_page}-{first_page + len(pages) - 1}: "
+        f"{len(pages) - len(ocr_pages)} of {len(pages)} from the text layer"
+    )
+    return ocr_pages